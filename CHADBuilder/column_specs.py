@@ -0,0 +1,62 @@
+"""
+Column specifications for the C&V extract categories, used by CHADBuilder.process_data.safe_read to load each
+extract with compact column types and without the columns Populate never uses. Each specification is a
+dictionary with the keys:
+    * dtype - {column: dtype}, "category" for low-cardinality text fields
+    * skip - list of columns not loaded
+Columns not named in a specification are loaded with default type inference, so specifications never change the
+values written to the database.
+"""
+
+# Result extracts (Pathology panels, Microbiology, ComplexHaematology and Radiology) carry demographics that
+# are dropped on load
+RESULTS_SPEC = {"dtype": {"REQUEST_LOCATION": "category"},
+                "skip": ["AGE", "GENDER", "ADMISSION_DATE"]}
+
+COLUMN_SPECS = {"People": {"dtype": {"GENDER": "category",
+                                     "TEST_PATIENT": "category"},
+                           "skip": []},
+                "Outcomes": {"dtype": {"COMPONENT": "category",
+                                       "EVENT_TYPE": "category",
+                                       "COVID_STATUS": "category",
+                                       "SOURCE_TYPE": "category",
+                                       "SOURCE": "category"},
+                             "skip": ["WIMD", "GENDER"]},
+                "CoMorbid": {"dtype": {},
+                             "skip": ["AGE", "GENDER", "ADMISSION_DATE", "TAKEN_DATE", "REQUEST_LOCATION"]},
+                "CritCare": {"dtype": {"UNIT": "category",
+                                       "UNIT_OUTCOME": "category",
+                                       "HOSP_OUTCOME": "category",
+                                       "ETHNICITY": "category",
+                                       "COVID19_STATUS": "category",
+                                       "REQUEST_LOCATION": "category"},
+                             "skip": []},
+                "AsperELISA": RESULTS_SPEC,
+                "AsperPCR": RESULTS_SPEC,
+                "BCult": RESULTS_SPEC,
+                "BGluc": RESULTS_SPEC,
+                "RESPL": RESULTS_SPEC,
+                "Covid19": RESULTS_SPEC,
+                "CompAlt": RESULTS_SPEC,
+                "CompClass": RESULTS_SPEC,
+                "XRChest": RESULTS_SPEC,
+                "CTangio": RESULTS_SPEC}
+
+
+def column_spec(category: str,
+                default: dict or None = None) -> dict or None:
+    """
+    Column specification for an extract category
+
+    Parameters
+    ----------
+    category: str
+        Extract category (file name without extension) e.g. "Outcomes"
+    default: dict, optional
+        Returned if the category has no specification
+
+    Returns
+    -------
+    dict or None
+    """
+    return COLUMN_SPECS.get(category, default)
@@ -0,0 +1,118 @@
+import sqlite3 as sql
+import time
+import os
+
+
+class DatetimeCache:
+    """
+    Persistent cache of parsed date/time strings, stored as a SQLite database, mapping the raw (stripped) string
+    to the ISO 8601 value produced by 'parse_datetime' (or None if the string could not be parsed). Used by
+    'parse_datetimes' for values that need dateparser, so that strings seen by a previous build, another table
+    or another process are not parsed again. Strings that dateparser resolves against the current date
+    (e.g. "14:05" or "yesterday") are never stored, as their value changes over time. The cache is bounded: once it holds more than 'max_entries'
+    strings, the least recently used are evicted down to 90% of 'max_entries'.
+
+    Parameters
+    ----------
+    path: str
+        Location of the cache database; created if it does not exist
+    max_entries: int, default=1000000
+        Maximum number of strings held
+    timeout: float, default=60.
+        Seconds to wait for another process holding a lock on the cache
+    """
+    def __init__(self,
+                 path: str,
+                 max_entries: int = 1000000,
+                 timeout: float = 60.):
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Connections cannot be shared between processes; each process opens its own
+        state = self.__dict__.copy()
+        state["_connection"], state["_pid"] = None, None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def connection(self) -> sql.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sql.connect(self.path, timeout=self.timeout)
+            self._pid = os.getpid()
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS datetimes "
+                                         "(raw TEXT PRIMARY KEY, value TEXT, last_used REAL NOT NULL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS datetimes_last_used ON datetimes (last_used)")
+        return self._connection
+
+    def get(self,
+            values: iter,
+            batch_size: int = 500) -> dict:
+        """
+        Look up strings in the cache, marking those found as used
+
+        Parameters
+        ----------
+        values: iterable
+            Stripped date/time strings
+        batch_size: int, default=500
+
+        Returns
+        -------
+        dict
+            {string: ISO 8601 string or None} for the strings held in the cache
+        """
+        values = list(values)
+        found = dict()
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            rows = self.connection.execute(f"SELECT raw, value FROM datetimes WHERE raw IN "
+                                           f"({','.join('?' * len(batch))})", batch).fetchall()
+            found.update(rows)
+        if found:
+            with self.connection:
+                self.connection.executemany("UPDATE datetimes SET last_used=? WHERE raw=?",
+                                            [(time.time(), x) for x in found.keys()])
+        return found
+
+    def put(self,
+            parsed: dict):
+        """
+        Add parsed strings to the cache, evicting the least recently used strings if the cache is full
+
+        Parameters
+        ----------
+        parsed: dict
+            {string: ISO 8601 string or None}
+
+        Returns
+        -------
+        None
+        """
+        if not parsed:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO datetimes (raw, value, last_used) VALUES (?,?,?)",
+                                        [(k, v, now) for k, v in parsed.items()])
+            n = self.connection.execute("SELECT COUNT(*) FROM datetimes").fetchone()[0]
+            if n > self.max_entries:
+                self.connection.execute("DELETE FROM datetimes WHERE raw IN (SELECT raw FROM datetimes "
+                                        "ORDER BY last_used ASC LIMIT ?)", (n - int(self.max_entries * 0.9),))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM datetimes").fetchone()[0]
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection, self._pid = None, None
@@ -1,9 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from CHADBuilder.manifest import Manifest
 from tqdm import tqdm
 from warnings import warn
+import threading
 import requests
+import hashlib
+import random
+import glob
 import time
 import os
 
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    """
+    Create a HTTP session that keeps connections to securefileshare alive between requests
+
+    Parameters
+    ----------
+    pool_size: int, default = 10
+        Maximum number of connections kept open to the host; should be at least the number of
+        concurrent workers sharing the session
+
+    Returns
+    -------
+    requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _default_session() -> requests.Session:
+    """
+    Session shared by all calls in this module that are not given an explicit session
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = create_session()
+        return _SESSION
+
+
+def _backoff(attempt: int,
+             base: float,
+             response: requests.Response or None = None,
+             cap: float = 60.) -> float:
+    """
+    Delay in seconds before the next attempt. Honours a Retry-After header on the failed response, otherwise
+    uses exponential backoff with jitter: a random delay between half and all of base * 2 ** attempt.
+
+    Parameters
+    ----------
+    attempt: int
+        Number of the attempt that failed, starting from 0
+    base: float
+        Delay following the first failed attempt
+    response: requests.Response, optional
+        The failed response, if one was received
+    cap: float, default = 60
+        Maximum delay (excluding delays requested by Retry-After)
+
+    Returns
+    -------
+    float
+    """
+    retry_after = None if response is None else response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0., float(retry_after))
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return max(0., (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _base_url(filehost: str) -> str:
+    """
+    Base URL for a filehost. Hosts are contacted over HTTPS unless 'filehost' already includes a scheme
+    (e.g. "http://127.0.0.1:8000" for a local stand-in server).
+
+    Parameters
+    ----------
+    filehost: str
+
+    Returns
+    -------
+    str
+    """
+    if filehost.startswith("http://") or filehost.startswith("https://"):
+        return filehost.rstrip("/")
+    return f"https://{filehost}"
+
 
 def get_credentials(path: str):
     """
@@ -25,7 +128,8 @@ def get_credentials(path: str):
 
 def get_token(username: str,
               pw: str,
-              filehost: str = "securefileshare.wales.nhs.uk") -> dict:
+              filehost: str = "securefileshare.wales.nhs.uk",
+              session: requests.Session or None = None) -> dict:
     """
     Fetch Bearer token for securefileshare
 
@@ -34,64 +138,212 @@ def get_token(username: str,
     username: str
     pw: str
     filehost: str
+    session: requests.Session, optional
+        HTTP session to use; defaults to the session shared by this module
 
     Returns
     -------
     dict
         Dictionary. Access token under key "access_token"
     """
-    endpoint = f"https://{filehost}/api/v1/token"
+    endpoint = f"{_base_url(filehost)}/api/v1/token"
     data = {"grant_type": "password",
             "username": username,
             "password": pw}
-    token = requests.post(endpoint,
-                          data=data,
-                          verify=False)
+    session = session or _default_session()
+    token = session.post(endpoint,
+                         data=data,
+                         verify=False)
     assert token.status_code == 200, f"Request failed. Error code: {token.status_code}"
     json = token.json()
     token.close()
     return json
 
 
-def _fetch_page(token: dict,
+def refresh_token(token: str,
+                  filehost: str = "securefileshare.wales.nhs.uk",
+                  session: requests.Session or None = None) -> dict:
+    """
+    Exchange a refresh token for a new Bearer token for securefileshare
+
+    Parameters
+    ----------
+    token: str
+        Refresh token (as returned under "refresh_token" by 'get_token')
+    filehost: str
+    session: requests.Session, optional
+        HTTP session to use; defaults to the session shared by this module
+
+    Returns
+    -------
+    dict
+        Dictionary. Access token under key "access_token"
+    """
+    endpoint = f"{_base_url(filehost)}/api/v1/token"
+    data = {"grant_type": "refresh_token",
+            "refresh_token": token}
+    session = session or _default_session()
+    response = session.post(endpoint,
+                            data=data,
+                            verify=False)
+    assert response.status_code == 200, f"Request failed. Error code: {response.status_code}"
+    json = response.json()
+    response.close()
+    return json
+
+
+class TokenProvider:
+    """
+    Supplies a valid Bearer token for securefileshare, safe to share between concurrent workers. The expiry
+    reported by the token endpoint ("expires_in") is tracked and the token is refreshed with the
+    "refresh_token" grant shortly before it expires, falling back to logging in with the stored credentials
+    if the refresh fails. Credentials are read once, when the provider is created.
+
+    Parameters
+    ----------
+    filehost: str, default = "securefileshare.wales.nhs.uk"
+    credentials_path: str, optional
+        Path to login file (see 'get_credentials'); defaults to "login.txt" in the working directory
+    session: requests.Session, optional
+        HTTP session to use; defaults to the session shared by this module
+    refresh_margin: float, default = 60
+        Seconds before expiry at which the token is refreshed
+    """
+    def __init__(self,
+                 filehost: str = "securefileshare.wales.nhs.uk",
+                 credentials_path: str or None = None,
+                 session: requests.Session or None = None,
+                 refresh_margin: float = 60.):
+        self.filehost = filehost
+        self.session = session
+        self.refresh_margin = refresh_margin
+        credentials_path = credentials_path or f"{os.getcwd()}/login.txt"
+        self._username, self._pw = get_credentials(credentials_path)
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._refresh_token = None
+        self._expires_at = 0.
+
+    def _update(self, json: dict):
+        access_token = json.get("access_token")
+        assert access_token is not None, "Access token is null"
+        self._access_token = access_token
+        self._refresh_token = json.get("refresh_token")
+        expires_in = json.get("expires_in")
+        self._expires_at = float("inf") if expires_in is None else time.monotonic() + float(expires_in)
+
+    def _renew(self):
+        if self._refresh_token is not None:
+            try:
+                self._update(refresh_token(self._refresh_token, self.filehost, self.session))
+                return
+            except (AssertionError, ValueError, requests.exceptions.RequestException):
+                pass
+        self._update(get_token(self._username, self._pw, self.filehost, self.session))
+
+    def token(self) -> str:
+        """
+        Current access token, renewed first if it is missing or about to expire
+
+        Returns
+        -------
+        str
+        """
+        with self._lock:
+            if self._access_token is None or time.monotonic() >= self._expires_at - self.refresh_margin:
+                self._renew()
+            return self._access_token
+
+    def invalidate(self, stale: str):
+        """
+        Report that a token was rejected by the server. The token is renewed unless another worker has
+        already replaced it.
+
+        Parameters
+        ----------
+        stale: str
+            The rejected access token
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._access_token == stale:
+                self._access_token = None
+
+
+def _bearer(token: str or TokenProvider) -> str:
+    """
+    Access token from either a token string or a TokenProvider
+
+    Parameters
+    ----------
+    token: str or TokenProvider
+
+    Returns
+    -------
+    str
+    """
+    if isinstance(token, TokenProvider):
+        return token.token()
+    return token
+
+
+def _fetch_page(token: str or TokenProvider,
                 endpoint: str,
                 sleep: int,
-                max_repeats: int) -> dict:
+                max_repeats: int,
+                session: requests.Session or None = None) -> dict:
     """
     Fetch a single page from the securefileshare site.
 
     Parameters
     ----------
-    token: dict
-        Dictionary containing 'access_token'
+    token: str or TokenProvider
+        Bearer access token, or a TokenProvider from which a current token is taken on every attempt
     endpoint: str
         API endpoint
     sleep: int
-        Delay in seconds between requests
+        Base delay in seconds for backing off between failed attempts
     max_repeats: int
         Maximum attempts
+    session: requests.Session, optional
+        HTTP session to use; defaults to the session shared by this module
 
     Returns
     -------
     dict
         Dictionary of page content. If max_attempts exceeded, TimeoutError raised.
     """
-    header = {"Authorization": f"Bearer {token}"}
+    session = session or _default_session()
     for i in range(max_repeats):
-        json = requests.get(endpoint,
-                            headers=header).json()
+        access_token = _bearer(token)
+        header = {"Authorization": f"Bearer {access_token}"}
+        response = None
+        try:
+            response = session.get(endpoint,
+                                   headers=header)
+            json = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            json = dict()
         if json.get("message") != "Authorization has been denied for this request.":
             if json.get("message") != "Internal Server Error":
                 if json.get("items") is not None:
                     return json
-        time.sleep(sleep)
+        elif isinstance(token, TokenProvider):
+            token.invalidate(access_token)
+            continue
+        if i < max_repeats - 1:
+            time.sleep(_backoff(i, sleep, response))
     raise TimeoutError("Failed to fetch page...timed out")
 
 
 def get_pages(directory_id: str = "662104718",
               filehost: str = "securefileshare.wales.nhs.uk",
               sleep: int = 2,
-              max_repeats: int = 5) -> dict:
+              max_repeats: int = 5,
+              token_provider: TokenProvider or None = None) -> dict:
     """
     Fetch a summary of all pages on securefileshare
 
@@ -102,70 +354,254 @@ def get_pages(directory_id: str = "662104718",
     filehost: str, default="securefileshare.wales.nhs.uk"
         Host address
     sleep: int, default = 2
-        Delay between requests
+        Base delay in seconds for backing off between failed requests
     max_repeats: int
         Maximum number of attempts
+    token_provider: TokenProvider, optional
+        Source of access tokens; if not given, one is created using "login.txt" in the working directory
 
     Returns
     -------
     dict
         {page_number: page_content[dict]}
     """
-    username, pw = get_credentials(f"{os.getcwd()}/login.txt")
-    token = get_token(username, pw, filehost).get("access_token")
-    assert token is not None, "Access token is null"
+    session = _default_session()
+    token = token_provider or TokenProvider(filehost, session=session)
     # First determine how many pages there are...
-    endpoint = f"https://{filehost}/api/v1/folders/{directory_id}/files?page=1"
+    endpoint = f"{_base_url(filehost)}/api/v1/folders/{directory_id}/files?page=1"
     print("---- Determining number of pages ----")
-    json = _fetch_page(token, endpoint, sleep, max_repeats)
+    json = _fetch_page(token, endpoint, sleep, max_repeats, session)
     page_n = json.get("paging").get("totalPages")
     print(f"...total pages: {page_n}")
     # For each page, go through and fetch the file names
     pages = dict()
     print("---- Summarising page content ----")
     for i in tqdm(range(1, page_n + 1)):
-        endpoint = f"https://{filehost}/api/v1/folders/{directory_id}/files?page={i}"
-        try:
-            pages[i] = _fetch_page(token, endpoint, sleep, max_repeats).get("items")
-        except TimeoutError:
-            username, pw = get_credentials(f"{os.getcwd()}/login.txt")
-            token = get_token(username, pw, filehost).get("access_token")
-            pages[i] = _fetch_page(token, endpoint, sleep, max_repeats).get("items")
-        time.sleep(sleep)
+        endpoint = f"{_base_url(filehost)}/api/v1/folders/{directory_id}/files?page={i}"
+        pages[i] = _fetch_page(token, endpoint, sleep, max_repeats, session).get("items")
     return pages
 
 
-def _write_csv(text: str,
-               write_path: str):
+class RateLimiter:
+    """
+    Thread-safe rate limiter shared between download workers. Calls to 'wait' are spaced so that
+    no more than 'rate' requests per second are started across all workers.
+
+    Parameters
+    ----------
+    rate: float or None
+        Maximum number of requests started per second. If None, no limit is applied.
+    """
+    def __init__(self, rate: float or None = None):
+        self.interval = 0. if not rate else 1. / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        """
+        Block until the calling worker is permitted to start its next request.
+
+        Returns
+        -------
+        None
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _stream_to_file(response: requests.Response,
+                    part_path: str,
+                    mode: str,
+                    chunk_size: int) -> bool:
+    """
+    Write the body of a streamed response to a partial download file in chunks
+
+    Parameters
+    ----------
+    response: requests.Response
+        Response opened with stream=True
+    part_path: str
+        Partial download file
+    mode: str
+        "wb" to start a new file or "ab" to append to an existing partial file
+    chunk_size: int
+        Number of bytes read per chunk
+
+    Returns
+    -------
+    bool
+        True if the full body was received, False if the response was an error message, empty or
+        shorter than the reported Content-Length
+    """
+    expected = response.headers.get("Content-Length")
+    if expected is None or response.headers.get("Content-Encoding"):
+        expected = None
+    written = 0
+    with open(part_path, mode) as file:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if written == 0 and mode == "wb":
+                if b"Authorization has been denied for this request" in chunk[:1024]:
+                    return False
+                if b"Internal Server Error" in chunk[:1024]:
+                    return False
+            file.write(chunk)
+            written += len(chunk)
+    if written == 0 and mode == "wb":
+        return False
+    if expected is not None and written != int(expected):
+        return False
+    return True
+
+
+def _content_range(response: requests.Response) -> (int or None, int or None):
+    """
+    Starting byte of a partial content response and the total size of the file, parsed from the
+    Content-Range header (None where not given)
+
+    Parameters
+    ----------
+    response: requests.Response
+
+    Returns
+    -------
+    int or None, int or None
+    """
+    content_range = response.headers.get("Content-Range", "")
+    try:
+        start = int(content_range.split(" ")[1].split("-")[0])
+    except (IndexError, ValueError):
+        return None, None
+    try:
+        return start, int(content_range.split("/")[1])
+    except (IndexError, ValueError):
+        return start, None
+
+
+def _part_path(write_path: str,
+               modified: str or None = None) -> str:
+    """
+    Partial download file for a file. Where the version of the file is known ('modified' in the page content),
+    it is part of the name, so that a partial download of an earlier version is never resumed.
+
+    Parameters
+    ----------
+    write_path: str
+        Path of the downloaded file
+    modified: str, optional
+
+    Returns
+    -------
+    str
+    """
+    if modified is None:
+        return f"{write_path}.part"
+    return f"{write_path}.{hashlib.sha1(str(modified).encode('utf-8')).hexdigest()[:12]}.part"
+
+
+def _discard_parts(write_path: str,
+                   keep: str or None = None):
     """
-    Write file to csv
+    Delete partial downloads of a file (see _part_path), other than 'keep'
 
     Parameters
     ----------
-    text: str
     write_path: str
+        Path of the downloaded file
+    keep: str, optional
 
     Returns
     -------
     None
     """
-    with open(write_path, "w") as file:
-        file.write(text)
+    parts = [f"{write_path}.part"] + glob.glob(f"{glob.escape(write_path)}.*.part")
+    for part_path in parts:
+        if part_path != keep and os.path.isfile(part_path):
+            os.remove(part_path)
+
+
+def _attempt_download(session: requests.Session,
+                      header: dict,
+                      endpoint: str,
+                      part_path: str,
+                      chunk_size: int,
+                      size: int or None = None) -> (bool, requests.Response or None):
+    """
+    Make a single attempt at streaming a file into 'part_path', resuming from the end of any existing
+    partial file. The partial file is deleted (and the next attempt starts from the beginning) if it is
+    not shorter than 'size', or if the response to the range request does not start at its end or reports
+    a total size other than 'size'.
 
+    Parameters
+    ----------
+    session: requests.Session
+    header: dict
+        Authorization header
+    endpoint: str
+    part_path: str
+    chunk_size: int
+    size: int, optional
+        Size of the file in bytes, as given in the page content
 
-def _download(token: str,
+    Returns
+    -------
+    bool, requests.Response or None
+        Whether the file is complete, and the response received (if any)
+    """
+    header = dict(header)
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if offset and size is not None and offset >= size:
+        os.remove(part_path)
+        offset = 0
+    if offset:
+        header["Range"] = f"bytes={offset}-"
+    try:
+        with session.get(endpoint, headers=header, stream=True) as response:
+            if response.status_code == 416:
+                os.remove(part_path)
+                return False, response
+            if response.status_code not in [200, 206]:
+                return False, response
+            mode = "wb"
+            if response.status_code == 206:
+                start, total = _content_range(response)
+                if start != offset or (size is not None and total is not None and total != size):
+                    os.remove(part_path)
+                    return False, response
+                mode = "ab"
+            return _stream_to_file(response, part_path, mode, chunk_size), response
+    except requests.exceptions.RequestException:
+        return False, None
+
+
+def _download(token: str or TokenProvider,
               endpoint: str,
               file_name: str,
               output_dir: str,
               sleep: int = 2,
-              max_repeats: int = 5):
+              max_repeats: int = 5,
+              chunk_size: int = 1048576,
+              session: requests.Session or None = None,
+              size: int or None = None,
+              modified: str or None = None):
     """
-    Download a file from securefileshare
+    Download a file from securefileshare. The file is streamed to a partial file "<file_name>.csv[.<version>].part"
+    and only renamed to "<file_name>.csv" once complete, so an interrupted download never leaves a truncated csv
+    file. If a partial file of the same version already exists, the download is resumed with a HTTP Range request
+    (where the server does not support ranges, the download restarts from the beginning); partial files of
+    other versions are deleted.
 
     Parameters
     ----------
-    token: str
-        Bearer access token
+    token: str or TokenProvider
+        Bearer access token, or a TokenProvider from which a current token is taken on every attempt
     endpoint: str
         API endpoint where file is found
     file_name: str
@@ -173,33 +609,138 @@ def _download(token: str,
     output_dir: str
         Where to download the file too
     sleep: int, default = 2
-        Delay in seconds between requests
+        Base delay in seconds for backing off between failed attempts
     max_repeats: int, default=5
         Max number of attempts
+    chunk_size: int, default=1048576
+        Number of bytes held in memory at any one time
+    session: requests.Session, optional
+        HTTP session to use; defaults to the session shared by this module
+    size: int, optional
+        Size of the file in bytes ("size" in the page content); a partial file is only resumed if the server
+        reports the same size
+    modified: str, optional
+        Version of the file ("modified" in the page content); a partial file is only resumed if it was
+        started from the same version
 
     Returns
     -------
     None
         Writes file to disk or raises TimeoutError is max_repeats exceeded.
     """
-    header = {"Authorization": f"Bearer {token}"}
+    session = session or _default_session()
+    write_path = os.path.join(output_dir, f"{file_name}.csv")
+    part_path = _part_path(write_path, modified)
+    _discard_parts(write_path, keep=part_path)
+    size = int(size) if size is not None else None
     for i in range(max_repeats):
-        file = requests.get(endpoint, headers=header).text
-        if file is None:
-            time.sleep(sleep)
-            continue
-        if len(file) == 0:
-            time.sleep(sleep)
+        access_token = _bearer(token)
+        header = {"Authorization": f"Bearer {access_token}"}
+        complete, response = _attempt_download(session, header, endpoint, part_path, chunk_size, size)
+        if complete:
+            os.replace(part_path, write_path)
+            return None
+        if response is not None and response.status_code == 401 and isinstance(token, TokenProvider):
+            token.invalidate(access_token)
             continue
-        if "Authorization has been denied for this request" in file:
-            time.sleep(sleep)
+        if i < max_repeats - 1:
+            time.sleep(_backoff(i, sleep, response))
+    raise TimeoutError("Failed to fetch file...timed out")
+
+
+def _fetch_file(token_provider: TokenProvider,
+                endpoint: str,
+                item: dict,
+                output_dir: str,
+                sleep: int,
+                max_repeats: int,
+                limiter: RateLimiter or None = None,
+                session: requests.Session or None = None) -> bool:
+    """
+    Download a single file, warning rather than raising if all attempts fail.
+
+    Parameters
+    ----------
+    token_provider: TokenProvider
+    endpoint: str
+    item: dict
+        Page content for the file
+    output_dir: str
+    sleep: int
+    max_repeats: int
+    limiter: RateLimiter, optional
+    session: requests.Session, optional
+
+    Returns
+    -------
+    bool
+        True if file was written to disk, False if all attempts failed
+    """
+    if limiter is not None:
+        limiter.wait()
+    try:
+        _download(token=token_provider,
+                  endpoint=endpoint,
+                  file_name=item.get("name"),
+                  output_dir=output_dir,
+                  sleep=sleep,
+                  max_repeats=max_repeats,
+                  session=session,
+                  size=item.get("size"),
+                  modified=item.get("modified"))
+        return True
+    except TimeoutError:
+        warn(f"Failed to fetch file {item.get('name')} after multiple attempts...")
+        return False
+
+
+def _page_items(pages: dict) -> list:
+    """
+    Flatten page content (as generated by 'get_pages') into a single list, warning about empty pages
+
+    Parameters
+    ----------
+    pages: dict
+
+    Returns
+    -------
+    list
+    """
+    items = list()
+    for i, page_content in pages.items():
+        if page_content is None:
+            warn(f"Page {i} is empty!")
             continue
-        if "Internal Server Error" in file:
-            time.sleep(sleep)
+        if len(page_content) == 0:
+            warn(f"No page content for page {i}")
             continue
-        _write_csv(file, f"{output_dir}/{file_name}.csv")
-        return None
-    raise TimeoutError("Failed to fetch file...timed out")
+        items.extend(page_content)
+    return items
+
+
+def _downloaded(item: dict,
+                output_dir: str,
+                manifest: Manifest or None,
+                on_download: callable or None):
+    """
+    Record a completed download in the manifest and pass it on to 'on_download'
+
+    Parameters
+    ----------
+    item: dict
+        Page content for the file
+    output_dir: str
+    manifest: Manifest or None
+    on_download: callable or None
+
+    Returns
+    -------
+    None
+    """
+    if manifest is not None:
+        manifest.record(item, output_dir)
+    if on_download is not None:
+        on_download(os.path.join(output_dir, f"{item.get('name')}.csv"))
 
 
 def get_files(pages: dict,
@@ -207,7 +748,14 @@ def get_files(pages: dict,
               directory_id: str = "662104718",
               filehost: str = "securefileshare.wales.nhs.uk",
               sleep: int = 3,
-              max_repeats: int = 10):
+              max_repeats: int = 10,
+              workers: int = 1,
+              rate_limit: float or None = None,
+              token_provider: TokenProvider or None = None,
+              manifest: str or None = ".manifest.json",
+              verify_checksums: bool = False,
+              dry_run: bool = False,
+              on_download: callable or None = None) -> dict or None:
     """
     Given a dictionary of page content (as generated by 'get_pages') download all files in target directory
     on securefileshare
@@ -223,58 +771,72 @@ def get_files(pages: dict,
     filehost: str, default = "securefileshare.wales.nhs.uk"
         URL of filehost
     sleep: int, default = 3
-        delay in seconds between requests
+        Base delay in seconds for backing off between failed requests
     max_repeats: int, default = 10
         Maximum number of attempts per file
+    workers: int, default = 1
+        Number of files downloaded concurrently. If 1, files are downloaded one at a time.
+    rate_limit: float, optional
+        Maximum number of downloads started per second, shared across all workers. Only applies when
+        workers > 1; if None, the number of workers is the only limit.
+    token_provider: TokenProvider, optional
+        Source of access tokens, shared by all workers; if not given, one is created using "login.txt" in the
+        working directory
+    manifest: str or None, default = ".manifest.json"
+        Manifest file (relative to output_dir) recording previously downloaded files (see
+        CHADBuilder.manifest.Manifest). Only files that are new, changed upstream or missing/corrupt locally
+        are downloaded. If None, any file whose name already exists in output_dir is skipped.
+    verify_checksums: bool, default = False
+        Recompute the checksum of every local copy when comparing against the manifest
+    dry_run: bool, default = False
+        If True, report which files would be downloaded without downloading anything
+    on_download: callable, optional
+        Called with the local path of each file as soon as it has been downloaded (called from the thread
+        that called 'get_files')
 
     Returns
     -------
-    None
+    dict or None
+        If dry_run is True, {"new": [...], "changed": [...], "corrupt": [...], "unchanged": [...]} listing
+        page content for each file; otherwise None
     """
-    username, pw = get_credentials(f"{os.getcwd()}/login.txt")
-    token = get_token(username, pw, filehost).get("access_token")
-    assert token is not None, "Access token is null"
     output_dir = os.path.join(os.getcwd(), output_dir)
-    for i, page_content in pages.items():
-        if page_content is None:
-            warn(f"Page {i} is empty!")
-            continue
-        print(f"---- Fetching files from page {i} ----")
-        file_names = [x.get("name") for x in page_content]
-        file_ids = [x.get("id") for x in page_content]
-        if len(file_names) == 0:
-            warn(f"No page content for page {i}")
-            continue
-        files = list(zip(file_names, file_ids))
-        existing_files = os.listdir(output_dir)
-        for file_name, file_id in tqdm(files):
-            if f"{file_name}.csv" in existing_files:
-                continue
-            endpoint = f"https://{filehost}/api/v1/folders/{directory_id}/files/{file_id}/download"
-            try:
-                _download(token=token,
-                          endpoint=endpoint,
-                          file_name=file_name,
-                          output_dir=output_dir,
-                          sleep=sleep,
-                          max_repeats=max_repeats)
-            except TimeoutError:
-                username, pw = get_credentials(f"{os.getcwd()}/login.txt")
-                token = get_token(username, pw, filehost).get("access_token")
-                assert token is not None, "Access token is null"
-                try:
-                    _download(token=token,
-                              endpoint=endpoint,
-                              file_name=file_name,
-                              output_dir=output_dir,
-                              sleep=sleep,
-                              max_repeats=max_repeats)
-                except TimeoutError:
-                    warn(f"Failed to fetch file {file_name} after multiple attempts...")
-            time.sleep(sleep)
+    items = _page_items(pages)
+    if manifest is not None:
+        manifest = Manifest(os.path.join(output_dir, manifest))
+        plan = manifest.plan(items, output_dir, verify_checksums=verify_checksums)
+    else:
+        existing_files = set(os.listdir(output_dir))
+        plan = {"new": [x for x in items if f"{x.get('name')}.csv" not in existing_files],
+                "changed": list(),
+                "corrupt": list(),
+                "unchanged": [x for x in items if f"{x.get('name')}.csv" in existing_files]}
+    print(f"---- {len(plan['new'])} new, {len(plan['changed'])} changed, {len(plan['corrupt'])} missing or "
+          f"corrupt, {len(plan['unchanged'])} unchanged ----")
+    if dry_run:
+        return plan
+    for item in plan["changed"] + plan["corrupt"]:
+        _discard_parts(os.path.join(output_dir, f"{item.get('name')}.csv"))
+    queue = [(f"{_base_url(filehost)}/api/v1/folders/{directory_id}/files/{x.get('id')}/download", x)
+             for x in plan["new"] + plan["changed"] + plan["corrupt"]]
+    try:
+        with create_session(pool_size=max(workers, 1)) as session:
+            token_provider = token_provider or TokenProvider(filehost, session=session)
+            if workers <= 1:
+                for endpoint, item in tqdm(queue):
+                    if _fetch_file(token_provider, endpoint, item, output_dir, sleep, max_repeats,
+                                   session=session):
+                        _downloaded(item, output_dir, manifest, on_download)
+            else:
+                limiter = RateLimiter(rate_limit)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(_fetch_file, token_provider, endpoint, item, output_dir,
+                                               sleep, max_repeats, limiter, session): item
+                               for endpoint, item in queue}
+                    for future in tqdm(as_completed(futures), total=len(futures)):
+                        if future.result():
+                            _downloaded(futures[future], output_dir, manifest, on_download)
+    finally:
+        if manifest is not None:
+            manifest.save()
     print("COMPLETE!")
-
-
-
-
-
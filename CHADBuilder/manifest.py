@@ -0,0 +1,193 @@
+from warnings import warn
+import hashlib
+import json
+import os
+
+# Fields of the securefileshare page content that identify the version of a file. Only "id" and "name" are
+# relied upon elsewhere (see fetch_data.get_files); these names are those of the folder listing as understood
+# when the manifest was written and either may be absent, in which case it is not compared (see Manifest)
+VERSION_FIELDS = ["size", "modified"]
+
+
+def file_checksum(path: str,
+                  chunk_size: int = 1048576) -> str:
+    """
+    SHA-256 checksum of a file, read in chunks
+
+    Parameters
+    ----------
+    path: str
+    chunk_size: int, default=1048576
+
+    Returns
+    -------
+    str
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Local index of files downloaded from securefileshare, stored as JSON. For each securefileshare file id the
+    manifest records the file name, the size and modified time reported by securefileshare ("size" and
+    "modified" of the page content) and the size and checksum of the local copy. This allows 'get_files' to
+    download only files that are new, have changed upstream or whose local copy is missing or corrupt.
+
+    Fields missing from the page content (or the manifest) are not compared: if neither "size" nor "modified"
+    is given, changes upstream cannot be detected and only new files and missing or corrupt local copies are
+    downloaded. Local files not in the manifest (e.g. downloaded before it existed) are adopted if their size
+    matches "size" or, where "size" is not given, if they are not empty.
+
+    Parameters
+    ----------
+    path: str
+        Location of the manifest file; created on 'save' if it does not exist
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.files = dict()
+        if os.path.isfile(path):
+            with open(path, "r") as file:
+                self.files = json.load(file).get("files", dict())
+
+    @staticmethod
+    def _local_path(item: dict,
+                    output_dir: str) -> str:
+        return os.path.join(output_dir, f"{item.get('name')}.csv")
+
+    def _status(self,
+                item: dict,
+                output_dir: str,
+                verify_checksums: bool) -> str:
+        """
+        Classify a file from the page content as "new", "changed", "corrupt" or "unchanged"
+
+        Parameters
+        ----------
+        item: dict
+            Page content for a single file
+        output_dir: str
+        verify_checksums: bool
+
+        Returns
+        -------
+        str
+        """
+        local_path = self._local_path(item, output_dir)
+        entry = self.files.get(str(item.get("id")))
+        if entry is None:
+            # Files downloaded before the manifest existed are adopted if their size matches (or, where the
+            # size is unknown, if they are not empty)
+            if os.path.isfile(local_path):
+                local_size, size = os.path.getsize(local_path), item.get("size")
+                if (size is None and local_size > 0) or (size is not None and local_size == int(size)):
+                    self.record(item, output_dir)
+                    return "unchanged"
+            return "new"
+        if entry.get("name") != item.get("name"):
+            return "changed"
+        for key in VERSION_FIELDS:
+            if None not in [item.get(key), entry.get(key)] and item.get(key) != entry.get(key):
+                return "changed"
+        if not os.path.isfile(local_path):
+            return "corrupt"
+        if os.path.getsize(local_path) != entry.get("local_size"):
+            return "corrupt"
+        if verify_checksums and file_checksum(local_path) != entry.get("checksum"):
+            return "corrupt"
+        return "unchanged"
+
+    def plan(self,
+             items: list,
+             output_dir: str,
+             verify_checksums: bool = False) -> dict:
+        """
+        Compare page content against the manifest and local files
+
+        Parameters
+        ----------
+        items: list
+            Page content (list of dictionaries with at least "id" and "name") for every file
+        output_dir: str
+            Directory containing local copies
+        verify_checksums: bool, default=False
+            If True, the checksum of every local copy is recomputed; otherwise local copies are only
+            checked for existence and size
+
+        Returns
+        -------
+        dict
+            {"new": [...], "changed": [...], "corrupt": [...], "unchanged": [...]}, each a list of page content
+        """
+        if items and all(x.get(key) is None for x in items for key in VERSION_FIELDS):
+            warn(f"Page content gives none of {', '.join(VERSION_FIELDS)}; files changed upstream will not be "
+                 f"downloaded again")
+        plan = {"new": list(), "changed": list(), "corrupt": list(), "unchanged": list()}
+        for item in items:
+            plan[self._status(item, output_dir, verify_checksums)].append(item)
+        return plan
+
+    def record(self,
+               item: dict,
+               output_dir: str):
+        """
+        Record a successfully downloaded file
+
+        Parameters
+        ----------
+        item: dict
+            Page content for the file
+        output_dir: str
+
+        Returns
+        -------
+        None
+        """
+        local_path = self._local_path(item, output_dir)
+        self.files[str(item.get("id"))] = {"name": item.get("name"),
+                                           "size": item.get("size"),
+                                           "modified": item.get("modified"),
+                                           "local_size": os.path.getsize(local_path),
+                                           "checksum": file_checksum(local_path)}
+
+    def refresh(self,
+                output_dir: str,
+                names: list or None = None):
+        """
+        Record the current size and checksum of local copies that have been modified after download (e.g. by
+        CHADBuilder.process_data.clean_complex_text), so that they are not treated as corrupt
+
+        Parameters
+        ----------
+        output_dir: str
+        names: list, optional
+            File names (without extension) to refresh; defaults to all files in the manifest
+
+        Returns
+        -------
+        None
+        """
+        for entry in self.files.values():
+            local_path = os.path.join(output_dir, f"{entry.get('name')}.csv")
+            if (names is not None and entry.get("name") not in names) or not os.path.isfile(local_path):
+                continue
+            entry["local_size"] = os.path.getsize(local_path)
+            entry["checksum"] = file_checksum(local_path)
+
+    def save(self):
+        """
+        Write the manifest to disk, replacing any previous version atomically
+
+        Returns
+        -------
+        None
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": 1, "files": self.files}, file, indent=1)
+        os.replace(tmp_path, self.path)
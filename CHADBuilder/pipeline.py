@@ -0,0 +1,48 @@
+from CHADBuilder.process_data import ConsolidationWorkers
+from CHADBuilder.fetch_data import get_files
+import os
+
+
+def fetch_and_consolidate(pages: dict,
+                          output_dir: str = "data",
+                          write_path: str or None = None,
+                          **kwargs) -> dict:
+    """
+    Download files from securefileshare and consolidate them by category in a single pass. Each file is
+    handed to a consolidation worker for its category as soon as it has been downloaded, so downloading and
+    parsing overlap. Files already present locally (and unchanged according to the manifest) are consolidated
+    alongside the new downloads. Produces the same consolidated files as calling 'get_files' followed by
+    'consolidate', although rows within a category follow the order in which files arrive.
+
+    Parameters
+    ----------
+    pages: dict
+        Dictionary of page content as generated by 'get_pages'
+    output_dir: str, default = "data" (in working directory)
+        Where to store downloaded files locally
+    write_path: str, optional
+        Consolidated csv files are written to "consolidated" within this directory (as with 'consolidate');
+        defaults to output_dir
+    kwargs:
+        Additional keyword arguments passed to 'get_files'
+
+    Returns
+    -------
+    dict
+        {category: [error messages]} for any files that could not be consolidated
+    """
+    output_dir = os.path.join(os.getcwd(), output_dir)
+    write_path = os.path.join(write_path or output_dir, "consolidated")
+    workers = ConsolidationWorkers(write_path)
+    try:
+        plan = get_files(pages, output_dir=output_dir, dry_run=True,
+                         **{k: v for k, v in kwargs.items() if k in ["manifest", "verify_checksums"]})
+        for item in plan["unchanged"]:
+            workers.submit(os.path.join(output_dir, f"{item.get('name')}.csv"))
+        get_files(pages, output_dir=output_dir, on_download=workers.submit, **kwargs)
+    finally:
+        errors = workers.close()
+    for category, messages in errors.items():
+        for message in messages:
+            print(message)
+    return errors
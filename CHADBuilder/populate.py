@@ -1,16 +1,136 @@
-from CHADBuilder.utilities import parse_datetime, verbose_print, progress_bar
+from CHADBuilder.utilities import parse_datetimes, verbose_print, progress_bar
 from CHADBuilder.schema import create_database
-from CHADBuilder.process_data import safe_read
+from CHADBuilder.process_data import safe_read, ChunkedReader, COLUMNAR_FORMATS
+from CHADBuilder.column_specs import column_spec, RESULTS_SPEC
+from CHADBuilder.datetime_cache import DatetimeCache
 from multiprocessing import Pool, cpu_count
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from collections import namedtuple, Counter
 from functools import partial
 from tqdm import tqdm
 from typing import List
 import sqlite3 as sql
+import tempfile
+import shutil
 import pandas as pd
+import numpy as np
+import math
 import re
 import os
 
 
+# Applied for the duration of Populate.populate; the database is regenerated from scratch if a build fails, so
+# durability is traded for write speed
+BUILD_PRAGMAS = {"journal_mode": "MEMORY",
+                 "synchronous": "OFF",
+                 "cache_size": -262144,
+                 "temp_store": "MEMORY"}
+
+# Index plan applied by Populate.create_indexes, following the usual access paths: results for a patient and test
+# or for a test category and test, in time order. Leading columns serve the narrower filters (e.g. patient_id
+# alone) and the per-patient Pathology and Microbiology indexes also cover the result, so those lookups never
+# read the table
+INDEXES = ["CREATE INDEX IF NOT EXISTS path_pt_name_time "
+           "ON Pathology (patient_id, test_name, collection_datetime, test_result)",
+           "CREATE INDEX IF NOT EXISTS path_cat_name_time ON Pathology (test_category, test_name, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS path_name_time ON Pathology (test_name, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS micro_pt_name_time "
+           "ON Microbiology (patient_id, test_name, collection_datetime, test_result)",
+           "CREATE INDEX IF NOT EXISTS micro_name_result_time "
+           "ON Microbiology (test_name, test_result, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS result_micro ON Microbiology (test_result)",
+           "CREATE INDEX IF NOT EXISTS haem_pt_name_time "
+           "ON ComplexHaematology (patient_id, test_name, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS haem_cat_name_time "
+           "ON ComplexHaematology (test_category, test_name, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS radiology_pt_time ON Radiology (patient_id, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS radiology_cat_time ON Radiology (test_category, collection_datetime)",
+           "CREATE INDEX IF NOT EXISTS events_pt_time ON Events (patient_id, event_datetime)",
+           "CREATE INDEX IF NOT EXISTS type_event_time ON Events (event_type, event_datetime)",
+           "CREATE INDEX IF NOT EXISTS covid_event ON Events (covid_status)",
+           "CREATE INDEX IF NOT EXISTS crit_care_pt_id ON CritCare (patient_id)",
+           "CREATE INDEX IF NOT EXISTS crit_care_ventilated ON CritCare (ventilated)",
+           "CREATE INDEX IF NOT EXISTS crit_care_covid ON CritCare (covid_status)"]
+
+# Patterns for the sample type and result reported in the TEXT of each Microbiology extract
+MICRO_PATTERNS = {"AsperELISA": (re.compile(r'Specimen received: ([\w\d\s\(\)\[\]]+) Aspergillus ELISA'),
+                                 re.compile(r"Aspergillus Antigen \(Galactomannan\) ([\w\d\s\(\)\[\]]+)")),
+                  "AsperPCR": (re.compile(r'Specimen received: ([\w\d\s\(\)\[\]]+) Aspergillus PCR'),
+                               re.compile(r"PCR\s(DNA\s[Not]*\sDetected)")),
+                  "BCult": (re.compile(r'Specimen received:([\w\s\d\(\)\[\]\-]*)(Culture|Microscopy)'),
+                            re.compile(r"(Culture|Microscopy-)([\w\s\d]*)")),
+                  "BGluc": (re.compile(r'Specimen received:([\w\s\d\(\)\[\]\-]*) Mycology reference unit'),
+                            re.compile(r"Mycology reference unit Cardiff Beta Glucan Antigen Test :"
+                                       r"([\w\s\d<>/\.\-]*)")),
+                  "RESPL": (re.compile(r'Specimen received:([\w\s\d<>/\.\-]*) (Microbiological '
+                                       r'investigation of respiratory viruses|RESPL)'),
+                            re.compile(r"(Microbiological investigation of respiratory viruses|RESPL)"
+                                       r"([\w\s\d<>/\.\-\(\):]*)"))}
+
+# Table builders run by Populate.populate, in order. Each declares the attribute listing its input files, the
+# tables it writes and the builders that must complete first ('after'), along with the extracts it reads through
+# the shared source cache ('sources', see Populate._source). Stages are independent unless related by 'after'
+# and so may run concurrently (see Populate.populate), except that stages sharing a source run in the same worker
+# so that the source is read once (see _stage_groups)
+Stage = namedtuple("Stage", ["method", "files", "tables", "after", "sources"])
+STAGES = [Stage("_patients", "patient_files", ["Patients"], [], ["Covid19", "Outcomes"]),
+          Stage("_comorbid", "comorbid_files", ["Comorbid"], [], []),
+          Stage("_events", "events_files", ["Events"], [], ["Outcomes"]),
+          Stage("_pathology", "path_files", ["Pathology", "PathologySummary"], [], []),
+          Stage("_microbiology", "micro_files", ["Microbiology"], [], ["Covid19"]),
+          Stage("_radiology", "radiology_files", ["Radiology"], [], []),
+          Stage("_critical_care", "critcare_files", ["CritCare"], [], []),
+          Stage("_haem", "haem_files", ["ComplexHaematology"], [], []),
+          Stage("_test_units", "units_files", ["Units"], [], [])]
+
+
+def _stage_groups(stages: List[Stage]) -> List[List[Stage]]:
+    """
+    Group stages that read a common source (directly or through another stage), so that each group can run in
+    a single worker and read its sources once. Groups, and the stages within them, keep the order of 'stages'.
+
+    Parameters
+    ----------
+    stages: list
+
+    Returns
+    -------
+    list
+    """
+    groups = list()
+    for stage in stages:
+        shared = [g for g in groups if set(stage.sources) & set([x for member in g for x in member.sources])]
+        groups = [g for g in groups if g not in shared] + [[x for g in shared for x in g] + [stage]]
+    groups = [sorted(g, key=stages.index) for g in groups]
+    return sorted(groups, key=lambda g: stages.index(g[0]))
+
+
+def _records(df: pd.DataFrame) -> list:
+    """
+    Convert a DataFrame to a list of row tuples of Python values for insertion with executemany, converting
+    values as DataFrame.to_sql would: missing values become None and datetimes "YYYY-MM-DD hh:mm:ss" strings.
+
+    Parameters
+    ----------
+    df: Pandas.DataFrame
+
+    Returns
+    -------
+    list
+    """
+    columns = list()
+    for col_name in df.columns:
+        values = df[col_name]
+        missing = values.isnull().values
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.Series([x.isoformat(" ") for x in values.fillna(pd.Timestamp(0)).dt.to_pydatetime()])
+        values = np.array(values.astype(object).values, dtype=object)
+        values[missing] = None
+        columns.append(values.tolist())
+    return list(zip(*columns))
+
+
 def chunker(seq: pd.DataFrame,
             size: int):
     """
@@ -60,6 +180,47 @@ def _re_search_df(pattern: str,
     return match.groups()[group_idx]
 
 
+def extract_group(values: iter,
+                  pattern: re.Pattern,
+                  group_idx: int = 0) -> list:
+    """
+    Vectorised equivalent of applying _re_search_df to every value: search each string for the (compiled)
+    pattern and return the only group if the pattern has one capturing group, otherwise the group at the given
+    index. None is returned where there is no match (or the value is not a string).
+
+    Parameters
+    ----------
+    values: iterable
+        Strings to parse
+    pattern: re.Pattern
+        Compiled regular expression with 1 or more capturing groups
+    group_idx: int
+        Group index to extract
+
+    Returns
+    -------
+    list
+    """
+    # Object dtype ensures Python's re module is used, whatever the string storage
+    groups = pd.Series(values, dtype=object).str.extract(pattern, expand=True)
+    groups = groups.iloc[:, 0 if groups.shape[1] == 1 else group_idx]
+    return [x if type(x) is str else None for x in groups.values]
+
+
+def _extract_micro_text(values: np.ndarray,
+                        sample_type_pattern: re.Pattern,
+                        result_pattern: re.Pattern) -> tuple:
+    """
+    Extract the sample type (group 0 of sample_type_pattern) and result (group 1 of result_pattern) from
+    Microbiology report text
+
+    Returns
+    -------
+    list, list
+    """
+    return extract_group(values, sample_type_pattern, 0), extract_group(values, result_pattern, 1)
+
+
 def _rename(df: pd.DataFrame,
             additional_mappings: dict or None = None) -> pd.DataFrame:
     """
@@ -121,6 +282,113 @@ def search_covid_results(patient_id: str,
     return "U", None
 
 
+def _isoformat(values: pd.Series) -> np.ndarray:
+    """
+    Format datetimes as ISO 8601 strings (YYYY-MM-DDThh:mm:ssZ); equivalent to
+    values.dt.strftime("%Y-%m-%dT%H:%M:%SZ") but without formatting each value in Python
+
+    Parameters
+    ----------
+    values: Pandas.Series
+        datetime64 values
+
+    Returns
+    -------
+    Numpy.Array
+        Object array of strings, None for missing values
+    """
+    if values.dt.tz is not None:
+        values = values.dt.tz_localize(None)
+    formatted = np.char.add(np.datetime_as_string(values.values.astype("datetime64[s]"), unit="s"), "Z")
+    return np.where(values.isnull().values, None, formatted.astype(object))
+
+
+def summarise_covid_results(covid_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Grouped equivalent of calling search_covid_results for every patient in a dataframe of COVID-19 PCR
+    results: a patient is "P" if they have any positive result, otherwise "N" if they have any negative result,
+    otherwise "U". The date of first positive is the earliest collection datetime of their positive results or,
+    if no positive result has a collection datetime, the test datetime of their first positive result (in the
+    order given).
+
+    Parameters
+    ----------
+    covid_df: Pandas.DataFrame
+        COVID-19 PCR results
+
+    Returns
+    -------
+    Pandas.DataFrame
+        Indexed by patient ID, with columns "covid_status" and "covid_date_first_positive"
+    """
+    results = pd.DataFrame({"PATIENT_ID": covid_df.PATIENT_ID.values,
+                            "positive": (covid_df.TEXT == "Positive").values,
+                            "negative": (covid_df.TEXT == "Negative").values})
+    results = results.groupby("PATIENT_ID", sort=False)[["positive", "negative"]].any()
+    positives = covid_df[covid_df.TEXT == "Positive"]
+    first_positive = positives.groupby("PATIENT_ID", sort=False).collection_datetime.min()
+    first_test = positives.drop_duplicates("PATIENT_ID").set_index("PATIENT_ID").test_datetime
+    first_positive = first_positive.fillna(first_test).reindex(results.index)
+    status = np.where(results.positive.values, "P", np.where(results.negative.values, "N", "U"))
+    return pd.DataFrame({"covid_status": status,
+                         "covid_date_first_positive": pd.Series(_isoformat(first_positive), index=results.index,
+                                                                dtype=object)},
+                        index=results.index)
+
+
+def register_deaths(patient_ids: pd.Series,
+                    events: pd.DataFrame,
+                    died_events: List[str]) -> np.ndarray:
+    """
+    Given patient IDs and the Outcomes events, flag the patients with a death event i.e. an event whose
+    DESTINATION is one of 'died_events'.
+
+    Parameters
+    ----------
+    patient_ids: Pandas.Series
+        Patient IDs; may contain duplicates
+    events: Pandas.DataFrame
+        Outcomes events, with columns PATIENT_ID and DESTINATION
+    died_events: list
+        Destinations that correspond to a patient death
+
+    Returns
+    -------
+    Numpy.Array
+        1 for each patient ID with a death event, otherwise 0
+    """
+    died = events.PATIENT_ID[events.DESTINATION.isin(died_events)].dropna().unique()
+    return patient_ids.map(pd.Series(1, index=died)).fillna(0).astype(int).values
+
+
+def build_indexes(connection: sql.Connection,
+                  statements: List[str] or None = None,
+                  verbose: bool = False):
+    """
+    Create indexes in a single transaction and then gather statistics for the query planner (ANALYZE). Intended
+    to run once the tables have been loaded, as building an index over loaded rows is far cheaper than
+    maintaining it row by row during the load.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+    statements: list, optional
+        CREATE INDEX statements (defaults to INDEXES)
+    verbose: bool, default=False
+        If True, show a progress bar
+
+    Returns
+    -------
+    None
+    """
+    statements = statements or INDEXES
+    with connection:
+        connection.execute("BEGIN")
+        for x in progress_bar(statements, verbose=verbose):
+            connection.execute(x)
+        connection.execute("ANALYZE")
+
+
 class Populate:
     """
     Create the CHADBuilder database and populate using C&V data extracts.
@@ -197,6 +465,19 @@ class Populate:
     events_files: list or None
         List of files expected when generating the Events table.
         Default =  ["Outcomes"]
+    datetime_cache: str or None
+        Location of a persistent cache of parsed date/time strings (see CHADBuilder.datetime_cache), shared
+        between tables and builds. If None (default), no cache is used.
+    workers: int or None
+        Number of worker processes used to parse date/time values that require dateparser. The worker pool
+        is started on first use and shared by all tables until 'close' is called (Populate can also be used
+        as a context manager). Default = number of CPUs.
+    memory_budget: int, default=1024
+        Approximate memory (MB) to use when processing a file. Pathology panel files are read, parsed, melted
+        and inserted in chunks of rows sized to fit within this budget.
+    drop_empty_results: bool, default=False
+        If True, results for analytes that were not measured (empty cells of a pathology panel file) are not
+        stored in the Pathology table. The number dropped is recorded in the PathologySummary table.
     """
     def __init__(self,
                  database_path: str,
@@ -211,12 +492,24 @@ class Populate:
                  critcare_files: List[str] or None = None,
                  radiology_files: List[str] or None = None,
                  events_files: List[str] or None = None,
-                 units_files: List[str] or None = None):
+                 units_files: List[str] or None = None,
+                 datetime_cache: str or None = None,
+                 workers: int or None = None,
+                 memory_budget: int = 1024,
+                 drop_empty_results: bool = False):
         self.verbose = verbose
+        self.drop_empty_results = drop_empty_results
+        self._sources = dict()
+        self._source_uses = dict()
+        self.memory_budget = memory_budget
+        self.workers = workers or cpu_count()
+        self._pool = None
         self.vprint = verbose_print(verbose)
+        self.database_path = database_path
         create_database(database_path, overwrite=True)
         self._connection = sql.connect(database_path)
         self._curr = self._connection.cursor()
+        self.datetime_cache = DatetimeCache(datetime_cache) if datetime_cache is not None else None
         self.data_path = data_path
         assert os.path.isdir(self.data_path), f"{data_path} is not a valid directory"
         self.path_files = path_files
@@ -306,7 +599,8 @@ class Populate:
                   file_basename: str):
         """
         Produce the file path for a given target file (file_basename expected to be without file extension
-        e.g. "Outcomes" not "Outcomes.csv"
+        e.g. "Outcomes" not "Outcomes.csv". Columnar files (see CHADBuilder.process_data.consolidate) are
+        preferred to csv files, unless the csv file is newer.
 
         Parameters
         ----------
@@ -316,15 +610,98 @@ class Populate:
         -------
         str
         """
-        return os.path.join(self.data_path, f"{file_basename}.csv")
+        csv_path = os.path.join(self.data_path, f"{file_basename}.csv")
+        for columnar in COLUMNAR_FORMATS:
+            path = os.path.join(self.data_path, f"{file_basename}.{columnar}")
+            if os.path.isfile(path):
+                if not os.path.isfile(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path):
+                    return path
+        return csv_path
+
+    def _read(self,
+              file_basename: str,
+              default_spec: dict or None = None) -> pd.DataFrame:
+        """
+        Read a target file (see _get_path) applying the column specification for its category
+        (see CHADBuilder.column_specs)
+
+        Parameters
+        ----------
+        file_basename: str
+        default_spec: dict, optional
+            Column specification used if the category has none
+
+        Returns
+        -------
+        Pandas.DataFrame
+        """
+        return safe_read(self._get_path(file_basename), spec=column_spec(file_basename, default_spec))
+
+    def _source(self,
+                file_basename: str,
+                columns: List[str] or None = None,
+                date_columns: List[str] or None = None) -> pd.DataFrame:
+        """
+        Read an extract through the source cache shared by the stages of a build. The extract is read once and
+        its date/time columns parsed once (see _get_date_time); while populate is running, the parsed extract is
+        kept until no remaining stage reads it (see STAGES). A copy is returned, so callers may modify it.
+
+        Parameters
+        ----------
+        file_basename: str
+        columns: list, optional
+            Columns to return (all if None)
+        date_columns: list, optional
+            Date/time columns to return parsed
+
+        Returns
+        -------
+        Pandas.DataFrame
+        """
+        df, parsed = self._sources.get(file_basename, (None, set()))
+        if df is None:
+            df = self._read(file_basename)
+        for col_name in [x for x in date_columns or [] if x not in parsed]:
+            df = self._get_date_time(df, col_name=col_name)
+            parsed.add(col_name)
+        if self._source_uses.get(file_basename, 0) > 0:
+            self._sources[file_basename] = (df, parsed)
+        if columns is not None:
+            return df[columns].copy()
+        return df.copy()
+
+    def _run_stages(self,
+                    stages: List[Stage]):
+        """
+        Run stages in turn, releasing cached sources (see _source) once no remaining stage reads them
+
+        Parameters
+        ----------
+        stages: list
+
+        Returns
+        -------
+        None
+        """
+        self._source_uses = Counter([x for stage in stages for x in stage.sources])
+        try:
+            for stage in stages:
+                getattr(self, stage.method)()
+                for source in stage.sources:
+                    self._source_uses[source] -= 1
+                    if self._source_uses[source] == 0:
+                        self._sources.pop(source, None)
+        finally:
+            self._sources, self._source_uses = dict(), dict()
 
     def _get_date_time(self,
                        df: pd.DataFrame,
                        col_name: str) -> pd.DataFrame:
         """
         Given a DataFrame and a target column (col_name) containing a string with date and/or time content, using
-        multiprocessing and the parse_datetime function, generate a new column for dates and a new column for times.
-        Original target column will be dropped and modified DataFrame returned.
+        the parse_datetimes function (with multiprocessing for values that require dateparser), generate a new
+        column for dates and a new column for times. Original target column will be dropped and modified
+        DataFrame returned.
 
         Parameters
         ----------
@@ -340,41 +717,83 @@ class Populate:
         -------
         Pandas.DataFrame
         """
-        with Pool(cpu_count()) as pool:
-            if self.verbose:
-                df[col_name] = tqdm(pool.imap(parse_datetime, df[col_name].values), total=len(df[col_name].values))
-            else:
-                df[col_name] = pool.map(parse_datetime, df[col_name].values)
+        if pd.api.types.is_datetime64_any_dtype(df[col_name]):
+            # Already parsed (read from a columnar file)
+            df[col_name] = df[col_name].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+            return df
+        df[col_name] = parse_datetimes(df[col_name].values, mapper=self._parse_map, cache=self.datetime_cache)
         return df
 
+    def _parse_map(self,
+                   func: callable,
+                   values: iter) -> list:
+        """
+        Apply a parsing function to values that could not be parsed in bulk (see parse_datetimes), using
+        the worker pool when there are enough values to justify the overhead. Values are sent to workers in
+        large chunks.
+
+        Parameters
+        ----------
+        func: callable
+        values: iterable
+
+        Returns
+        -------
+        list
+        """
+        if len(values) < 1000 or self.workers <= 1:
+            return list(map(func, values))
+        chunksize = max(256, math.ceil(len(values) / (self.workers * 4)))
+        if self.verbose:
+            return list(tqdm(self._get_pool().imap(func, values, chunksize=chunksize), total=len(values)))
+        return self._get_pool().map(func, values, chunksize=chunksize)
+
+    def _get_pool(self) -> Pool:
+        """
+        Worker pool shared by all tables, started on first use
+
+        Returns
+        -------
+        multiprocessing.Pool
+        """
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+        return self._pool
+
     def _insert(self,
                 df: pd.DataFrame,
-                table_name: str):
+                table_name: str,
+                progress: bool = True):
         """
         Given a DataFrame and some target table in the CHADBuilder database, append the contents of that
-        DataFrame into the target table, whilst also providing a progress bar is verbose set to True.
+        DataFrame into the target table, whilst also providing a progress bar is verbose set to True. Rows are
+        inserted with a prepared statement in a single transaction.
 
         Parameters
         ----------
         df: Pandas.DataFrame
         table_name: str
+        progress: bool, default=True
+            If False, no progress bar is shown regardless of verbose
 
         Returns
         -------
         None
         """
-        if not self.verbose:
-            df.to_sql(name=table_name, con=self._connection, if_exists="append", index=False)
-            return
-        chunk_size = int(df.shape[0]/10)
-        with tqdm(total=df.shape[0]) as pbar:
+        columns = ", ".join([f'"{x}"' for x in df.columns])
+        statement = f'INSERT INTO "{table_name}" ({columns}) VALUES ({", ".join("?" * df.shape[1])})'
+        chunk_size = max(int(df.shape[0]/10), 10000)
+        with self._connection, tqdm(total=df.shape[0], disable=not (self.verbose and progress)) as pbar:
             for chunk in chunker(df, chunk_size):
-                chunk.to_sql(name=table_name, con=self._connection, if_exists="append", index=False)
-                pbar.update(chunk_size)
+                self._connection.executemany(statement, _records(chunk))
+                pbar.update(chunk.shape[0])
 
     def _pathology(self):
         """
-        Generate the Pathology table
+        Generate the Pathology table. The number of results and of empty results (analytes not measured) for
+        each test are recorded in the PathologySummary table, along with the number dropped if
+        drop_empty_results is True, so that Pathology can be reconciled with the panel files.
+
         Returns
         -------
         None
@@ -382,23 +801,84 @@ class Populate:
         self.vprint("---- Populating Pathology Table ----")
         for file in self.path_files:
             self.vprint(f"Processing {file}....")
-            df = safe_read(self._get_path(file))
-            df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
-            df = self._get_date_time(df, col_name="TEST_DATE")
-            df = self._get_date_time(df, col_name="TAKEN_DATE")
-            df = df.melt(id_vars=["PATIENT_ID", "REQUEST_LOCATION", "TEST_DATE", "TAKEN_DATE"],
-                         var_name="test_name",
-                         value_name="test_result")
-            df["valid"] = df.test_result.apply(lambda x: int(x != "Issue with result"))
-            df["test_category"] = file
-            df = _rename(df, {"TEST_DATE": "test_datetime",
-                              "TAKEN_DATE": "collection_datetime"})
-            self._insert(df=df, table_name="Pathology")
+            reader = ChunkedReader(self._get_path(file), spec=column_spec(file, RESULTS_SPEC))
+            process = partial(self._pathology_chunk, file=file)
+            chunk_size = self._chunk_rows(reader, process)
+            chunks = progress_bar(reader.chunks(chunk_size), verbose=self.verbose,
+                                  total=math.ceil(reader.rows / chunk_size))
+            summary = list()
+            for df in chunks:
+                df = process(df)
+                summary.append(pd.DataFrame({"total": df.groupby("test_name", sort=False).size(),
+                                             "empty": df.test_result.isnull().groupby(df.test_name, sort=False).sum()}))
+                if self.drop_empty_results:
+                    df = df[df.test_result.notnull()]
+                self._insert(df=df, table_name="Pathology", progress=False)
+            if summary:
+                summary = pd.concat(summary).groupby(level=0, sort=False).sum().reset_index()
+                summary["test_category"] = file
+                summary["dropped"] = summary["empty"] if self.drop_empty_results else 0
+                self._insert(df=summary, table_name="PathologySummary", progress=False)
+
+    def _pathology_chunk(self,
+                         df: pd.DataFrame,
+                         file: str) -> pd.DataFrame:
+        """
+        Convert rows of a pathology panel file to the long format of the Pathology table
+
+        Parameters
+        ----------
+        df: Pandas.DataFrame
+            Rows of the panel file
+        file: str
+            Panel file (test category)
+
+        Returns
+        -------
+        Pandas.DataFrame
+        """
+        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
+        df = self._get_date_time(df, col_name="TEST_DATE")
+        df = self._get_date_time(df, col_name="TAKEN_DATE")
+        df = df.melt(id_vars=["PATIENT_ID", "REQUEST_LOCATION", "TEST_DATE", "TAKEN_DATE"],
+                     var_name="test_name",
+                     value_name="test_result")
+        df["valid"] = df.test_result.apply(lambda x: int(x != "Issue with result"))
+        df["test_category"] = file
+        return _rename(df, {"TEST_DATE": "test_datetime",
+                            "TAKEN_DATE": "collection_datetime"})
+
+    def _chunk_rows(self,
+                    reader: ChunkedReader,
+                    process: callable,
+                    sample_size: int = 1000) -> int:
+        """
+        Number of rows of a file to process at a time within the memory budget ('memory_budget'), estimated
+        from the memory used to read and process a sample of rows
+
+        Parameters
+        ----------
+        reader: CHADBuilder.process_data.ChunkedReader
+        process: callable
+            Processing applied to each chunk of rows
+        sample_size: int, default=1000
+
+        Returns
+        -------
+        int
+        """
+        sample = reader.sample(sample_size)
+        if sample.shape[0] == 0:
+            return sample_size
+        size = sample.memory_usage(deep=True).sum()
+        # The processed chunk is held alongside its renamed copy and the rows converted for insertion
+        size += 3 * process(sample.copy()).memory_usage(deep=True).sum()
+        return max(sample_size, int(self.memory_budget * 1048576 / (size / sample.shape[0])))
 
     def _process_micro_df(self,
                           df: pd.DataFrame,
-                          sample_type_pattern: str,
-                          result_pattern: str,
+                          sample_type_pattern: str or re.Pattern,
+                          result_pattern: str or re.Pattern,
                           test_name: str):
         """
         Template method for generalised processing of a Microbiology related DataFrame and subsequent appendage
@@ -407,9 +887,9 @@ class Populate:
         Parameters
         ----------
         df: Pandas.DataFrame
-        sample_type_pattern: str
+        sample_type_pattern: str or re.Pattern
             Search pattern used for identifying sample type in TEXT column
-        result_pattern: str
+        result_pattern: str or re.Pattern
             Search pattern used for identifying result in TEXT column
         test_name: str
             Test name corresponding to the DataFrame
@@ -417,18 +897,46 @@ class Populate:
         -------
         None
         """
-        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
+        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
         df = self._get_date_time(df, col_name="TEST_DATE")
         df = self._get_date_time(df, col_name="TAKEN_DATE")
-        # pull out the sample type
-        df["sample_type"] = df.TEXT.apply(lambda x: _re_search_df(pattern=sample_type_pattern, x=x, group_idx=0))
-        # Pull out result
-        df["test_result"] = df.TEXT.apply(lambda x: _re_search_df(pattern=result_pattern, x=x, group_idx=1))
+        # pull out the sample type and result
+        df["sample_type"], df["test_result"] = self._parse_micro_text(df.TEXT.values,
+                                                                       re.compile(sample_type_pattern),
+                                                                       re.compile(result_pattern))
         df["test_name"] = test_name
         df["valid"] = df.TEXT.apply(lambda x: int(x != "Issue with result"))
         df = _rename(df, {"TEXT": "raw_text", "TEST_DATE": "test_datetime", "TAKEN_DATE": "collection_datetime"})
         self._insert(df=df, table_name="Microbiology")
 
+    def _parse_micro_text(self,
+                          values: np.ndarray,
+                          sample_type_pattern: re.Pattern,
+                          result_pattern: re.Pattern,
+                          chunk_size: int = 50000) -> tuple:
+        """
+        Extract sample type and result from Microbiology report text (see the module-level function
+        _extract_micro_text), splitting large files across the worker pool
+
+        Parameters
+        ----------
+        values: Numpy.Array
+        sample_type_pattern: re.Pattern
+        result_pattern: re.Pattern
+        chunk_size: int, default=50000
+            Files with more rows than this are split into chunks of this many rows and parsed by the workers
+
+        Returns
+        -------
+        list, list
+        """
+        if len(values) <= chunk_size or self.workers <= 1:
+            return _extract_micro_text(values, sample_type_pattern, result_pattern)
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        results = self._get_pool().starmap(_extract_micro_text,
+                                           [(x, sample_type_pattern, result_pattern) for x in chunks])
+        return [x for r in results for x in r[0]], [x for r in results for x in r[1]]
+
     def _microbiology(self):
         """
         Populate the Microbiology table
@@ -441,56 +949,48 @@ class Populate:
 
         # AsperELISA ----------------------------
         self.vprint("...processing Aspergillus ELISA results")
-        df = safe_read(self._get_path("AsperELISA"))
-        sample_type_pattern = 'Specimen received: ([\w\d\s\(\)\[\]]+) Aspergillus ELISA'
-        result_pattern = "Aspergillus Antigen \(Galactomannan\) ([\w\d\s\(\)\[\]]+)"
+        df = self._read("AsperELISA")
+        sample_type_pattern, result_pattern = MICRO_PATTERNS["AsperELISA"]
         self._process_micro_df(df=df,
                                sample_type_pattern=sample_type_pattern,
                                result_pattern=result_pattern,
                                test_name="AsperELISA")
         # AsperPCR ----------------------------
         self.vprint("...processing Aspergillus PCR results")
-        df = safe_read(self._get_path("AsperPCR"))
-        sample_type_pattern = 'Specimen received: ([\w\d\s\(\)\[\]]+) Aspergillus PCR'
-        result_pattern = "PCR\s(DNA\s[Not]*\sDetected)"
+        df = self._read("AsperPCR")
+        sample_type_pattern, result_pattern = MICRO_PATTERNS["AsperPCR"]
         self._process_micro_df(df=df,
                                sample_type_pattern=sample_type_pattern,
                                result_pattern=result_pattern,
                                test_name="AsperELISA")
         # BCult ------------------------------
         self.vprint("...processing Blood Culture results")
-        df = safe_read(self._get_path("BCult"))
-        sample_type_pattern = 'Specimen received:([\w\s\d\(\)\[\]\-]*)(Culture|Microscopy)'
-        result_pattern = "(Culture|Microscopy-)([\w\s\d]*)"
+        df = self._read("BCult")
+        sample_type_pattern, result_pattern = MICRO_PATTERNS["BCult"]
         self._process_micro_df(df=df,
                                sample_type_pattern=sample_type_pattern,
                                result_pattern=result_pattern,
                                test_name="BloodCulture")
         # BGluc ------------------------------
         self.vprint("...processing Beta-Glucan results")
-        df = safe_read(self._get_path("BGluc"))
-        sample_type_pattern = 'Specimen received:([\w\s\d\(\)\[\]\-]*) Mycology reference unit'
-        result_pattern = "Mycology reference unit Cardiff Beta Glucan Antigen Test :([\w\s\d<>/\.\-]*)"
+        df = self._read("BGluc")
+        sample_type_pattern, result_pattern = MICRO_PATTERNS["BGluc"]
         self._process_micro_df(df=df,
                                sample_type_pattern=sample_type_pattern,
                                result_pattern=result_pattern,
                                test_name="BetaGlucan")
         # RESPL ------------------------------
         self.vprint("...processing Respiratory Virus results")
-        df = safe_read(self._get_path("RESPL"))
-        sample_type_pattern = 'Specimen received:([\w\s\d<>/\.\-]*) (Microbiological ' \
-                              'investigation of respiratory viruses|RESPL)'
-        result_pattern = "(Microbiological investigation of respiratory viruses|RESPL)([\w\s\d<>/\.\-\(\):]*)"
+        df = self._read("RESPL")
+        sample_type_pattern, result_pattern = MICRO_PATTERNS["RESPL"]
         self._process_micro_df(df=df,
                                sample_type_pattern=sample_type_pattern,
                                result_pattern=result_pattern,
                                test_name="RESPL")
         # Covid19 ----------------------------
         self.vprint("...processing Respiratory Virus results")
-        df = safe_read(self._get_path("Covid19"))
-        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
-        df = self._get_date_time(df, col_name="TEST_DATE")
-        df = self._get_date_time(df, col_name="TAKEN_DATE")
+        df = self._source("Covid19", date_columns=["TEST_DATE", "TAKEN_DATE"])
+        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
         df = _rename(df, additional_mappings={"TEXT": "test_result", "TEST_DATE": "test_datetime", "TAKEN_DATE": "collection_datetime"})
         df["valid"] = df.test_result.apply(lambda x: int(x != "Issue with result"))
         df["test_name"] = "Covid19-PCR"
@@ -506,8 +1006,8 @@ class Populate:
         """
         self.vprint("---- Populating Comorbid Table ----")
         for file in self.comorbid_files:
-            df = safe_read(self._get_path(file))
-            df.drop(["AGE", "GENDER", "ADMISSION_DATE", "TAKEN_DATE"], axis=1, inplace=True)
+            df = self._read(file)
+            df.drop(["AGE", "GENDER", "ADMISSION_DATE", "TAKEN_DATE"], axis=1, inplace=True, errors="ignore")
             df = _rename(df, additional_mappings={"SOLIDORGANTRANSPLANT": "solid_organ_transplant",
                                                   "CANCER": "cancer",
                                                   "SEVERERESPIRATORY": "severe_resp",
@@ -520,7 +1020,7 @@ class Populate:
                                                   "OTHER": "other",
                                                   "TEST_DATE": "datetime"})
             df = self._get_date_time(df=df, col_name="datetime")
-            df.drop("request_location", axis=1, inplace=True)
+            df.drop("request_location", axis=1, inplace=True, errors="ignore")
             self._insert(df=df, table_name="Comorbid")
 
     def _haem(self):
@@ -533,8 +1033,8 @@ class Populate:
         """
         self.vprint("---- Populating ComplexHaematology Table ----")
         for file in progress_bar(self.haem_files, verbose=self.verbose):
-            df = safe_read(self._get_path(file))
-            df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
+            df = self._read(file)
+            df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
             df = self._get_date_time(df, col_name="TEST_DATE")
             df = self._get_date_time(df, col_name="TAKEN_DATE")
             # pull out the sample type
@@ -558,21 +1058,14 @@ class Populate:
         Pandas.DataFrame
             Modified Pandas DataFrame with covid_status column
         """
-        covid = safe_read(self._get_path("Covid19"))
-        covid = self._get_date_time(covid, col_name="TEST_DATE")
-        covid = self._get_date_time(covid, col_name="TAKEN_DATE")
+        covid = self._source("Covid19", date_columns=["TEST_DATE", "TAKEN_DATE"])
         covid = covid.rename({"TEST_DATE": "test_datetime", "TAKEN_DATE": "collection_datetime"}, axis=1)
         covid["collection_datetime"] = pd.to_datetime(covid["collection_datetime"])
         covid["test_datetime"] = pd.to_datetime(covid["collection_datetime"])
-        covid_status = list()
-        if self.verbose:
-            patient_ids = tqdm(df.patient_id.values)
-        else:
-            patient_ids = df.patient_id.values
-        for pt_id in patient_ids:
-            covid_status.append(search_covid_results(patient_id=pt_id, covid_df=covid))
-        df["covid_status"] = [x[0] for x in covid_status]
-        df["covid_date_first_positive"] = [x[1] for x in covid_status]
+        summary = summarise_covid_results(covid)
+        df["covid_status"] = df.patient_id.map(summary.covid_status).fillna("U").values
+        first_positive = df.patient_id.map(summary.covid_date_first_positive).values
+        df["covid_date_first_positive"] = [x if type(x) is str else None for x in first_positive]
         return df
 
     def _register_death(self, df: pd.DataFrame):
@@ -587,16 +1080,8 @@ class Populate:
         Pandas.DataFrame
             Modified Pandas DataFrame with death column
         """
-        events = safe_read(self._get_path("Outcomes"))[["PATIENT_ID", "DESTINATION"]]
-        death_status = list()
-        for pt_id in progress_bar(df.patient_id.unique(), verbose=self.verbose):
-            pt_events = events[events.PATIENT_ID == pt_id]
-            pt_events = pt_events[pt_events.DESTINATION.isin(self.died_events)]
-            if pt_events.shape[0] == 0:
-                death_status.append(0)
-            else:
-                death_status.append(1)
-        df["death"] = death_status
+        events = self._source("Outcomes", columns=["PATIENT_ID", "DESTINATION"])
+        df["death"] = register_deaths(df.patient_id, events, self.died_events)
         return df
 
     def _patients(self):
@@ -609,7 +1094,7 @@ class Populate:
         """
         self.vprint("---- Populating Patients Table ----")
         self.vprint("...create basic table")
-        df = safe_read(self._get_path("People"))
+        df = self._read("People")
         df = df[df.TEST_PATIENT == "N"]
         df.drop("TEST_PATIENT", axis=1, inplace=True)
         df = self._get_date_time(df, col_name="DATE_FROM")
@@ -635,7 +1120,7 @@ class Populate:
         None
         """
         self.vprint("---- Populating Critical Care Table ----")
-        df = safe_read(self._get_path("CritCare"))
+        df = self._read("CritCare")
         df = self._get_date_time(df, col_name="UNIT_ADMIT_DATE")
         df = self._get_date_time(df, col_name="UNIT_DISCH_DATE")
         df = _rename(df, {"request_location": "location",
@@ -666,16 +1151,16 @@ class Populate:
         """
         self.vprint("---- Populate Radiology Table ----")
         self.vprint("....processing CT Angiogram pulmonary results")
-        df = safe_read(self._get_path("CTangio"))
-        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
+        df = self._read("CTangio")
+        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
         df = self._get_date_time(df, col_name="TEST_DATE")
         df = self._get_date_time(df, col_name="TAKEN_DATE")
         df["test_category"] = "CTangio"
         df = _rename(df, additional_mappings={"TEXT": "raw_text", "TEST_DATE": "test_datetime", "TAKEN_DATE": "collection_datetime"})
         self._insert(df=df, table_name="Radiology")
         self.vprint("....processing X-ray results")
-        df = safe_read(self._get_path("XRChest"))
-        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True)
+        df = self._read("XRChest")
+        df.drop(["AGE", "GENDER", "ADMISSION_DATE"], axis=1, inplace=True, errors="ignore")
         df = self._get_date_time(df, col_name="TEST_DATE")
         df = self._get_date_time(df, col_name="TAKEN_DATE")
         df["test_category"] = "XRChest"
@@ -691,9 +1176,8 @@ class Populate:
         None
         """
         self.vprint("---- Populate Events Table ----")
-        df = safe_read(self._get_path(self.events_files[0]))
-        df.drop(["WIMD", "GENDER"], axis=1, inplace=True)
-        df = self._get_date_time(df, col_name="EVENT_DATE")
+        df = self._source(self.events_files[0], date_columns=["EVENT_DATE"])
+        df.drop(["WIMD", "GENDER"], axis=1, inplace=True, errors="ignore")
         df["death"] = df.DESTINATION.apply(lambda x: int(any([i in str(x) for i in self.died_events])))
         df = df.rename({"PATIENT_ID": "patient_id",
                         "COMPONENT": "component",
@@ -708,12 +1192,138 @@ class Populate:
 
     def _test_units(self):
         self.vprint("---- Populate Units Table ----")
-        df = safe_read(self._get_path("TestUnits"))
+        df = self._read("TestUnits")
         self._insert(df=df, table_name="Units")
 
-    def populate(self):
+    @contextmanager
+    def _build_pragmas(self):
         """
-        Populate all tables.
+        Apply the build-time SQLite settings (BUILD_PRAGMAS), restoring the previous settings on exit
+
+        Returns
+        -------
+        None
+        """
+        previous = {k: self._connection.execute(f"PRAGMA {k}").fetchone()[0] for k in BUILD_PRAGMAS.keys()}
+        for k, v in BUILD_PRAGMAS.items():
+            self._connection.execute(f"PRAGMA {k}={v}")
+        try:
+            yield
+        finally:
+            for k, v in previous.items():
+                self._connection.execute(f"PRAGMA {k}={v}")
+
+    def _stage_options(self,
+                       jobs: int) -> dict:
+        """
+        Keyword arguments for the Populate instance that runs a stage in a worker process
+
+        Parameters
+        ----------
+        jobs: int
+            Number of stages run concurrently; date/time parsing workers and the memory budget are divided
+            between them
+
+        Returns
+        -------
+        dict
+        """
+        return {"data_path": self.data_path,
+                "verbose": False,
+                "died_events": self.died_events,
+                "path_files": self.path_files,
+                "micro_files": self.micro_files,
+                "comorbid_files": self.comorbid_files,
+                "patient_files": self.patient_files,
+                "haem_files": self.haem_files,
+                "critcare_files": self.critcare_files,
+                "radiology_files": self.radiology_files,
+                "events_files": self.events_files,
+                "units_files": self.units_files,
+                "datetime_cache": self.datetime_cache.path if self.datetime_cache is not None else None,
+                "workers": max(1, self.workers // jobs),
+                "memory_budget": max(64, self.memory_budget // jobs),
+                "drop_empty_results": self.drop_empty_results}
+
+    def _merge_stage(self,
+                     stage: Stage,
+                     staging_path: str):
+        """
+        Copy the tables written by a stage from its staging database into the CHADBuilder database
+
+        Parameters
+        ----------
+        stage: Stage
+        staging_path: str
+
+        Returns
+        -------
+        None
+        """
+        self._connection.execute("ATTACH DATABASE ? AS staging", (staging_path,))
+        try:
+            with self._connection:
+                for table_name in stage.tables:
+                    self._connection.execute(f'INSERT INTO main."{table_name}" SELECT * FROM staging."{table_name}"')
+        finally:
+            self._connection.execute("DETACH DATABASE staging")
+
+    def _populate_parallel(self,
+                           jobs: int):
+        """
+        Run the stages (STAGES) in up to 'jobs' worker processes. Stages sharing a source run in turn in the same
+        worker (see _stage_groups). Each worker writes to its own staging database, which is merged into the
+        CHADBuilder database as soon as the worker completes, so writes to the CHADBuilder database are
+        serialised. A worker is started once all the stages it follows have been merged.
+
+        Parameters
+        ----------
+        jobs: int
+
+        Returns
+        -------
+        None
+        """
+        staging_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(self.database_path)))
+        options = self._stage_options(jobs)
+        pending, complete, running = _stage_groups(STAGES), set(), dict()
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                while pending or running:
+                    for group in pending[:]:
+                        methods = [x.method for x in group]
+                        if not set([x for stage in group for x in stage.after]) - set(methods) <= complete:
+                            continue
+                        pending.remove(group)
+                        staging_path = os.path.join(staging_dir, f"{methods[0].strip('_')}.db")
+                        for stage in group:
+                            self.vprint(f"---- Started {stage.method.strip('_')} "
+                                        f"({', '.join(getattr(self, stage.files))}) ----")
+                        running[executor.submit(_run_stage, options, methods, staging_path)] = \
+                            (group, staging_path)
+                    finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        group, staging_path = running.pop(future)
+                        future.result()
+                        for stage in group:
+                            self._merge_stage(stage, staging_path)
+                            complete.add(stage.method)
+                            self.vprint(f"---- Completed {stage.method.strip('_')} ----")
+                        os.remove(staging_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def populate(self,
+                 jobs: int = 1):
+        """
+        Populate all tables. SQLite journaling and synchronous writes are relaxed for the duration of the
+        build (see BUILD_PRAGMAS) and restored afterwards.
+
+        Parameters
+        ----------
+        jobs: int, default=1
+            Number of tables built concurrently, each in a worker process (see STAGES). The date/time parsing
+            workers ('workers') are divided between them. If 1, tables are built in turn in this process.
 
         Returns
         -------
@@ -721,56 +1331,80 @@ class Populate:
         """
         self.vprint("=============== Populating database ===============")
         self.vprint("\n")
-        self._patients()
-        self._comorbid()
-        self._events()
-        self._pathology()
-        self._microbiology()
-        self._radiology()
-        self._critical_care()
-        self._haem()
-        self._test_units()
+        with self._build_pragmas():
+            if jobs <= 1:
+                self._run_stages(STAGES)
+            else:
+                self._populate_parallel(jobs)
         self.vprint("\n")
         self.vprint("Complete!....")
         self.vprint("====================================================")
 
     def create_indexes(self):
         """
-        Generate some useful indexes (ASSUMES THAT POPULATE METHOD HAS BEEN PREVIOUSLY CALLED)
+        Generate the indexes of the index plan (INDEXES) in a single transaction, under the build-time SQLite
+        settings, and gather statistics for the query planner (ASSUMES THAT POPULATE METHOD HAS BEEN PREVIOUSLY
+        CALLED)
 
         Returns
         -------
         None
         """
         self.vprint("=============== Generating Indexes ===============")
-        sql_statements = ["CREATE INDEX crit_care_pt_id ON CritCare (patient_id)",
-                          "CREATE INDEX events_pt_id ON Events (patient_id)",
-                          "CREATE INDEX radiology_pt_id ON Radiology (patient_id)",
-                          "CREATE INDEX haem_pt_id ON ComplexHaematology (patient_id)",
-                          "CREATE INDEX micro_pt_id ON Microbiology (patient_id)",
-                          "CREATE INDEX path_pt_id ON Pathology (patient_id)",
-                          "CREATE INDEX crit_care_ventilated ON CritCare (ventilated)",
-                          "CREATE INDEX crit_care_covid ON CritCare (covid_status)",
-                          "CREATE INDEX type_event ON Events (event_type)",
-                          "CREATE INDEX covid_event ON Events (covid_status)",
-                          "CREATE INDEX test_haem ON ComplexHaematology (test_category)",
-                          "CREATE INDEX name_micro ON Microbiology (test_name)",
-                          "CREATE INDEX result_micro ON Microbiology (test_result)",
-                          "CREATE INDEX name_path ON Pathology (test_name)",
-                          "CREATE INDEX cat_path ON Pathology (test_category)"]
-        for x in progress_bar(sql_statements, verbose=self.verbose):
-            self._curr.execute(x)
-            self._connection.commit()
+        with self._build_pragmas():
+            build_indexes(self._connection, verbose=self.verbose)
         self.vprint("\n")
         self.vprint("Complete!....")
         self.vprint("====================================================")
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self._pool is not None:
+            # Do not wait for work still queued by a failed stage
+            self._pool.terminate()
+        self.close()
+
     def close(self):
         """
-        Close database connection.
+        Close database connection, worker pool and date/time cache (if used).
 
         Returns
         -------
         None
         """
-        self._connection.close()
\ No newline at end of file
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._connection.close()
+        if self.datetime_cache is not None:
+            self.datetime_cache.close()
+
+
+def _run_stage(options: dict,
+               methods: List[str],
+               database_path: str) -> str:
+    """
+    Run Populate stages in turn in a worker process, writing to a staging database. Sources shared by the
+    stages are read once (see Populate._run_stages).
+
+    Parameters
+    ----------
+    options: dict
+        Keyword arguments for Populate (see Populate._stage_options)
+    methods: list
+        Stage methods e.g. ["_patients", "_events"]
+    database_path: str
+        Staging database, created with the CHADBuilder schema
+
+    Returns
+    -------
+    str
+        database_path
+    """
+    with Populate(database_path=database_path, **options) as pop:
+        with pop._build_pragmas():
+            pop._run_stages([x for x in STAGES if x.method in methods])
+    return database_path
@@ -1,9 +1,37 @@
+from CHADBuilder.utilities import parse_datetimes
+from CHADBuilder.datetime_cache import DatetimeCache
+from CHADBuilder.manifest import Manifest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from queue import Queue
 from tqdm import tqdm
 import pandas as pd
+import threading
 import chardet
+import codecs
+import shutil
+import json
+import math
 import os
 import csv
 
+# Categories larger than this (in bytes) are split across workers when consolidating with jobs > 1
+_SPLIT_BYTES = 268435456
+# Sidecar file recording the encoding of consolidated files, so that reading them requires no detection
+ENCODING_SIDECAR = ".encodings.json"
+_ENCODINGS = dict()
+_ENCODINGS_LOCK = threading.Lock()
+# Columnar formats 'consolidate' can write in addition to csv (both require pyarrow)
+COLUMNAR_FORMATS = ["parquet", "feather"]
+# Date/time columns of the C&V extracts, stored parsed in columnar files
+DATE_COLUMNS = ["TEST_DATE",
+                "TAKEN_DATE",
+                "ADMISSION_DATE",
+                "EVENT_DATE",
+                "DATE_FROM",
+                "DATE_ENTERED",
+                "UNIT_ADMIT_DATE",
+                "UNIT_DISCH_DATE"]
+
 
 def _remove_illegal_chars(x) -> str:
     """
@@ -20,32 +48,89 @@ def _remove_illegal_chars(x) -> str:
     return x.replace("\\\\", "").replace('"', "")
 
 
-def clean_complex_text(path: str):
+def _clean_file(path: str) -> bool:
+    """
+    Clean a single file containing complex text. Only the header row is read to decide whether the file has a
+    "TEXT" column; if so, rows are streamed through '_remove_illegal_chars' into a temporary file which then
+    replaces the original.
+
+    Parameters
+    ----------
+    path: str
+        File path
+    Returns
+    -------
+    bool
+        True if the file was cleaned, False if it has no "TEXT" column
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(path, "r", newline="") as original_file:
+            reader = csv.reader(original_file)
+            header = next(reader, None)
+            if header is None or "TEXT" not in header:
+                return False
+            with open(tmp_path, "w", newline="") as new_file:
+                writer = csv.writer(new_file, delimiter=',')
+                writer.writerow(list(map(_remove_illegal_chars, header)))
+                for row in reader:
+                    writer.writerow(list(map(_remove_illegal_chars, row)))
+        os.replace(tmp_path, path)
+        return True
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+
+def clean_complex_text(path: str,
+                       jobs: int = 1,
+                       manifest: str or None = ".manifest.json"):
     """
-    Clean files containing complex text. Warning: file is overwritten!
+    Clean files containing complex text. Warning: file is overwritten! Each file is streamed to a temporary
+    file that replaces the original once complete, so a failure never leaves a partially cleaned file. Partial
+    downloads (".part") and hidden files are left untouched. Cleaned files are refreshed in the download
+    manifest (see CHADBuilder.fetch_data.get_files) so that a later 'get_files' does not treat them as corrupt
+    and download them again.
 
     Parameters
     ----------
     path: str
         File path
+    jobs: int, default=1
+        Number of files cleaned in parallel (in worker processes)
+    manifest: str or None, default = ".manifest.json"
+        Name of the download manifest within path (ignored if it does not exist); pass None if the files were
+        not downloaded with a manifest
     Returns
     -------
     None
     """
     print("Attempting to clean complex text....")
-    for filename in tqdm(os.listdir(path)):
-        try:
-            original_file = open(os.path.join(path, filename), "r")
-            contents = list(csv.reader(original_file))
-            if "TEXT" not in contents[0]:
-                continue
-            original_file.close()
-            new_file = csv.writer(open(os.path.join(path, filename), "w"),
-                                  delimiter=',')
-            new_contents = [list(map(_remove_illegal_chars, x)) for x in contents]
-            new_file.writerows(new_contents)
-        except Exception as e:
-            print(f"Failed at {filename}: {str(e)}")
+    # Partial downloads are resumed byte for byte and dot-files (e.g. the manifest) are not extracts
+    filenames = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))
+                 and not f.startswith(".") and not f.endswith(".part")]
+    cleaned = list()
+    if jobs <= 1:
+        for filename in tqdm(filenames):
+            try:
+                if _clean_file(os.path.join(path, filename)):
+                    cleaned.append(filename)
+            except Exception as e:
+                print(f"Failed at {filename}: {str(e)}")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_clean_file, os.path.join(path, filename)): filename
+                       for filename in filenames}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    if future.result():
+                        cleaned.append(futures[future])
+                except Exception as e:
+                    print(f"Failed at {futures[future]}: {str(e)}")
+    if manifest is not None and cleaned and os.path.isfile(os.path.join(path, manifest)):
+        manifest = Manifest(os.path.join(path, manifest))
+        manifest.refresh(path, names=[os.path.splitext(x)[0] for x in cleaned])
+        manifest.save()
 
 
 def _read_dataframe(path: str, **kwargs):
@@ -57,21 +142,189 @@ def _read_dataframe(path: str, **kwargs):
         raise ValueError(f"Error parsing {path}: {str(e)}")
 
 
-def safe_read(path: str):
+def _file_key(path: str) -> tuple:
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def _sidecar_encoding(path: str) -> str or None:
     """
-    Attempt to read csv file as a Pandas DataFrame. Catches warnings for improved error handling.
+    Encoding of a file as recorded in the encoding sidecar of its directory, provided the file has not
+    changed since it was recorded
 
     Parameters
     ----------
     path: str
-        File path
+
+    Returns
+    -------
+    str or None
+    """
+    sidecar = os.path.join(os.path.dirname(os.path.abspath(path)), ENCODING_SIDECAR)
+    if not os.path.isfile(sidecar):
+        return None
+    try:
+        with open(sidecar, "r") as file:
+            entry = json.load(file).get(os.path.basename(path))
+    except ValueError:
+        return None
+    if entry is None:
+        return None
+    _, size, mtime_ns = _file_key(path)
+    if entry.get("size") != size or entry.get("mtime_ns") != mtime_ns:
+        return None
+    return entry.get("encoding")
+
+
+def record_encoding(directory: str,
+                    filenames: list,
+                    encoding: str = "utf-8"):
+    """
+    Record the encoding of files in the encoding sidecar of their directory (see ENCODING_SIDECAR)
+
+    Parameters
+    ----------
+    directory: str
+    filenames: list
+        Names of files within directory
+    encoding: str, default="utf-8"
+
+    Returns
+    -------
+    None
+    """
+    sidecar = os.path.join(directory, ENCODING_SIDECAR)
+    entries = dict()
+    if os.path.isfile(sidecar):
+        try:
+            with open(sidecar, "r") as file:
+                entries = json.load(file)
+        except ValueError:
+            pass
+    for filename in filenames:
+        _, size, mtime_ns = _file_key(os.path.join(directory, filename))
+        entries[filename] = {"encoding": encoding, "size": size, "mtime_ns": mtime_ns}
+    tmp_path = f"{sidecar}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(entries, file, indent=1)
+    os.replace(tmp_path, sidecar)
+
+
+def _detect_encoding(path: str,
+                     sample_size: int = 1048576,
+                     full: bool = False) -> str or None:
+    """
+    Detect the character encoding of a file. Results are cached for the lifetime of the process (keyed by
+    path, size and modification time) and encodings recorded in an encoding sidecar are used without
+    detection. Otherwise detection looks at the first 'sample_size' bytes: if they are valid UTF-8 the file is
+    assumed to be UTF-8, else chardet is run on the sample and, if not confident, over the whole file in
+    chunks until it is.
+
+    Parameters
+    ----------
+    path: str
+    sample_size: int, default=1048576
+        Number of bytes inspected by the fast path
+    full: bool, default=False
+        Ignore cached/recorded encodings and run chardet over the whole file; used when a file fails to decode
+        with the encoding detected from its sample
+
+    Returns
+    -------
+    str or None
+    """
+    key = _file_key(path)
+    if not full:
+        encoding = _ENCODINGS.get(key) or _sidecar_encoding(path)
+        if encoding is not None:
+            return encoding
+    with open(path, "rb") as file:
+        sample = file.read(sample_size)
+        encoding = None
+        if not full:
+            try:
+                codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < sample_size)
+                encoding = "utf-8-sig" if sample.startswith(codecs.BOM_UTF8) else "utf-8"
+            except UnicodeDecodeError:
+                result = chardet.detect(sample)
+                if result.get("confidence", 0) >= 0.9:
+                    encoding = result.get("encoding")
+        if encoding is None:
+            detector = chardet.UniversalDetector()
+            detector.feed(sample)
+            for chunk in iter(lambda: file.read(sample_size), b""):
+                if detector.done:
+                    break
+                detector.feed(chunk)
+            detector.close()
+            encoding = detector.result.get("encoding")
+    with _ENCODINGS_LOCK:
+        _ENCODINGS[key] = encoding
+    return encoding
+
+
+def _spec_kwargs(spec: dict or None) -> dict:
+    """
+    Keyword arguments for pd.read_csv implementing a column specification (see CHADBuilder.column_specs)
+
+    Parameters
+    ----------
+    spec: dict or None
+
+    Returns
+    -------
+    dict
+    """
+    kwargs = dict()
+    if spec is None:
+        return kwargs
+    if spec.get("dtype"):
+        kwargs["dtype"] = spec.get("dtype")
+    skip = spec.get("skip")
+    if skip:
+        kwargs["usecols"] = lambda x: x not in skip
+    return kwargs
+
+
+def _read_columnar(path: str,
+                   spec: dict or None = None) -> pd.DataFrame:
+    """
+    Read a Parquet or Feather file, loading only the columns not skipped by the column specification
+
+    Parameters
+    ----------
+    path: str
+    spec: dict, optional
+
     Returns
     -------
     Pandas.DataFrame
     """
-    encoding = chardet.detect(open(path, "rb").read()).get("encoding")
+    import pyarrow
+    columns = None
+    if spec is not None and spec.get("skip"):
+        if path.endswith(".parquet"):
+            import pyarrow.parquet
+            names = pyarrow.parquet.read_schema(path).names
+        else:
+            import pyarrow.ipc
+            names = pyarrow.ipc.open_file(path).schema.names
+        columns = [x for x in names if x not in spec.get("skip")]
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_feather(path, columns=columns)
+    if spec is not None and spec.get("dtype"):
+        df = df.astype({k: v for k, v in spec.get("dtype").items() if k in df.columns})
+    return df
+
+
+def _safe_read(path: str,
+               encoding: str or None,
+               spec: dict or None = None):
+    kwargs = _spec_kwargs(spec)
     try:
-        return _read_dataframe(path, encoding=encoding, low_memory=False)
+        return _read_dataframe(path, encoding=encoding, low_memory=False, **kwargs)
     except pd.errors.ParserError:
         try:
             return _read_dataframe(path,
@@ -79,11 +332,244 @@ def safe_read(path: str):
                                    escapechar="\\",
                                    quotechar='"',
                                    sep=",",
-                                   encoding=encoding)
+                                   encoding=encoding,
+                                   **kwargs)
         except pd.errors.ParserError as e:
             raise ValueError(f"Error parsing {path}: {str(e)}")
 
 
+def safe_read(path: str,
+              spec: dict or None = None):
+    """
+    Attempt to read csv file as a Pandas DataFrame. Catches warnings for improved error handling. Parquet and
+    Feather files (as written by 'consolidate' with columnar set) are also accepted, identified by their file
+    extension.
+
+    Parameters
+    ----------
+    path: str
+        File path
+    spec: dict, optional
+        Column specification giving column dtypes and columns to skip (see CHADBuilder.column_specs)
+    Returns
+    -------
+    Pandas.DataFrame
+    """
+    if path.endswith(".parquet") or path.endswith(".feather"):
+        return _read_columnar(path, spec)
+    encoding = _detect_encoding(path)
+    try:
+        return _safe_read(path, encoding, spec)
+    except UnicodeError:
+        full_encoding = _detect_encoding(path, full=True)
+        if full_encoding == encoding:
+            raise
+        return _safe_read(path, full_encoding, spec)
+
+
+def _read_chunks(path: str,
+                 chunksize: int,
+                 **kwargs):
+    """
+    Read a csv file as a sequence of Pandas DataFrames of at most 'chunksize' rows. Parsing errors are raised
+    as pd.errors.ParserError, so the caller can fall back to the python engine as in 'safe_read'.
+
+    Parameters
+    ----------
+    path: str
+    chunksize: int
+    kwargs:
+        Additional keyword arguments for pd.read_csv
+
+    Returns
+    -------
+    generator
+    """
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+            yield chunk
+    except UnicodeError as e:
+        raise UnicodeError(f"Error parsing {path}: {str(e)}")
+
+
+def _dtype_kind(values: pd.Series) -> str:
+    """
+    Classify the type pandas inferred for a column of a chunk: "n" (no values), "b" (bool), "i" (integer),
+    "f" (float) or "O" (anything else, i.e. text)
+    """
+    if values.isnull().all():
+        return "n"
+    if pd.api.types.is_bool_dtype(values):
+        return "b"
+    if pd.api.types.is_integer_dtype(values):
+        return "i"
+    if pd.api.types.is_float_dtype(values):
+        return "f"
+    return "O"
+
+
+def _resolve_dtype(kinds: set):
+    """
+    Column type pandas would infer for a whole file, given the kinds (see '_dtype_kind') inferred for each chunk
+    """
+    values = kinds - {"n"}
+    if not values or values <= {"i", "f"}:
+        return "float64" if "n" in kinds or "f" in kinds or not values else "int64"
+    if values == {"b"}:
+        return "boolean" if "n" in kinds else "bool"
+    return str
+
+
+class ChunkedReader:
+    """
+    Read a C&V extract (csv, Parquet or Feather) in chunks of rows, with the column types 'safe_read' gives when
+    reading the whole file. For csv files the column types are resolved by a first pass over the file (also in
+    chunks), so that, for example, a column holding numbers in one chunk and text in another is read as text
+    throughout. Memory use is bounded by the chunk size.
+
+    Parameters
+    ----------
+    path: str
+    spec: dict, optional
+        Column specification giving column dtypes and columns to skip (see CHADBuilder.column_specs)
+    scan_chunksize: int, default=100000
+        Rows per chunk for the first pass over csv files
+    """
+    def __init__(self,
+                 path: str,
+                 spec: dict or None = None,
+                 scan_chunksize: int = 100000):
+        self.path = path
+        self.spec = spec
+        self.columnar = path.endswith(".parquet") or path.endswith(".feather")
+        self.rows = 0
+        self._kwargs = dict()
+        if self.columnar:
+            self.rows = self._table().num_rows if path.endswith(".feather") else self._parquet().metadata.num_rows
+        else:
+            self._kwargs = self._resolve(scan_chunksize)
+
+    def _scan(self,
+              chunksize: int,
+              **kwargs) -> dict:
+        kinds, self.rows = dict(), 0
+        for chunk in _read_chunks(self.path, chunksize, **kwargs):
+            self.rows += chunk.shape[0]
+            for col_name in chunk.columns:
+                kinds.setdefault(col_name, set()).add(_dtype_kind(chunk[col_name]))
+        dtype = (self.spec or dict()).get("dtype") or dict()
+        return {k: dtype.get(k, _resolve_dtype(v)) for k, v in kinds.items()}
+
+    def _resolve(self,
+                 chunksize: int) -> dict:
+        """
+        First pass over a csv file, returning the keyword arguments for pd.read_csv (including the resolved
+        column types). Encoding detection and the python engine fallback follow 'safe_read'.
+        """
+        kwargs = {k: v for k, v in _spec_kwargs(self.spec).items() if k != "dtype"}
+        encoding = _detect_encoding(self.path)
+        try:
+            kwargs["encoding"] = encoding
+            kwargs["dtype"] = self._scan(chunksize, **kwargs)
+        except UnicodeError:
+            full_encoding = _detect_encoding(self.path, full=True)
+            if full_encoding == encoding:
+                raise
+            kwargs["encoding"] = full_encoding
+            kwargs["dtype"] = self._scan(chunksize, **kwargs)
+        except pd.errors.ParserError:
+            kwargs.update({"engine": "python", "escapechar": "\\", "quotechar": '"', "sep": ","})
+            try:
+                kwargs["dtype"] = self._scan(chunksize, **kwargs)
+            except pd.errors.ParserError as e:
+                raise ValueError(f"Error parsing {self.path}: {str(e)}")
+        return kwargs
+
+    def _columns(self,
+                 names: list) -> list or None:
+        if self.spec is None or not self.spec.get("skip"):
+            return None
+        return [x for x in names if x not in self.spec.get("skip")]
+
+    def _parquet(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetFile(self.path)
+
+    def _table(self):
+        import pyarrow.feather
+        import pyarrow.ipc
+        columns = self._columns(pyarrow.ipc.open_file(self.path).schema.names)
+        return pyarrow.feather.read_table(self.path, columns=columns, memory_map=True)
+
+    def _columnar_chunks(self,
+                         chunksize: int):
+        if self.path.endswith(".parquet"):
+            parquet = self._parquet()
+            batches = parquet.iter_batches(batch_size=chunksize, columns=self._columns(parquet.schema_arrow.names))
+        else:
+            table = self._table()
+            batches = (table.slice(i, chunksize) for i in range(0, table.num_rows, chunksize))
+        for batch in batches:
+            df = batch.to_pandas()
+            if self.spec is not None and self.spec.get("dtype"):
+                df = df.astype({k: v for k, v in self.spec.get("dtype").items() if k in df.columns})
+            yield df
+
+    def chunks(self,
+               chunksize: int):
+        """
+        Read the file as a sequence of Pandas DataFrames of at most 'chunksize' rows
+
+        Parameters
+        ----------
+        chunksize: int
+
+        Returns
+        -------
+        generator
+        """
+        if self.columnar:
+            return self._columnar_chunks(chunksize)
+        return _read_chunks(self.path, chunksize, **self._kwargs)
+
+    def sample(self,
+               nrows: int = 1000) -> pd.DataFrame:
+        """
+        The first 'nrows' rows of the file
+
+        Parameters
+        ----------
+        nrows: int, default=1000
+
+        Returns
+        -------
+        Pandas.DataFrame
+        """
+        chunks = self.chunks(nrows)
+        try:
+            return next(chunks)
+        except StopIteration:
+            return pd.DataFrame()
+        finally:
+            chunks.close()
+
+
+def _extract_files(path: str):
+    """
+    List the csv files in a directory containing C&V extracts (ignoring partial downloads and the
+    download manifest)
+
+    Parameters
+    ----------
+    path: str
+        Data directory
+    Returns
+    -------
+    list
+    """
+    return [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)) and f.endswith(".csv")]
+
+
 def _unique_categories(path: str):
     """
     List all the unique categories of files in a directory containing C&V extracts
@@ -96,12 +582,491 @@ def _unique_categories(path: str):
     -------
     list
     """
-    files = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
-    return list(set([x.split("-")[0] for x in files]))
+    return list(set([_category(x) for x in _extract_files(path)]))
+
+
+def _category(filename: str) -> str:
+    """
+    Category of a C&V extract, given its file name (e.g. "FBC-0001.csv" -> "FBC")
+
+    Parameters
+    ----------
+    filename: str
+
+    Returns
+    -------
+    str
+    """
+    return os.path.basename(filename).split("-")[0]
+
+
+class _CategoryWriter:
+    """
+    Appends DataFrames to the consolidated csv file for a single category. Columns not seen in earlier
+    DataFrames are added to the end of the header (the same column order as pd.concat) and the header line
+    is rewritten on 'close'.
+
+    Parameters
+    ----------
+    path: str
+        Consolidated csv file; overwritten on the first call to 'append'
+    columns: list, optional
+        Columns of the consolidated file, if known before the first DataFrame is appended
+    """
+    def __init__(self,
+                 path: str,
+                 columns: list or None = None):
+        self.path = path
+        self.columns = None
+        self._initial_columns = columns
+        self._header_changed = False
+
+    def append(self, df: pd.DataFrame):
+        """
+        Append a DataFrame to the consolidated file
+
+        Parameters
+        ----------
+        df: Pandas.DataFrame
+
+        Returns
+        -------
+        None
+        """
+        if self.columns is None:
+            self.columns = list(self._initial_columns or df.columns)
+            self.columns.extend([x for x in df.columns if x not in self.columns])
+            df.reindex(columns=self.columns).to_csv(self.path, index=False, mode="w", encoding="utf-8")
+            return
+        new_columns = [x for x in df.columns if x not in self.columns]
+        if new_columns:
+            self.columns.extend(new_columns)
+            self._header_changed = True
+        df.reindex(columns=self.columns).to_csv(self.path, index=False, header=False, mode="a", encoding="utf-8")
+
+    def checkpoint(self) -> tuple:
+        """
+        Current state of the writer, to be passed to 'restore'
+
+        Returns
+        -------
+        tuple
+        """
+        if self.columns is None:
+            return None, None, False
+        return os.path.getsize(self.path), list(self.columns), self._header_changed
+
+    def restore(self, checkpoint: tuple):
+        """
+        Discard everything appended since 'checkpoint' was called
+
+        Parameters
+        ----------
+        checkpoint: tuple
+
+        Returns
+        -------
+        None
+        """
+        position, columns, header_changed = checkpoint
+        if position is None:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+        else:
+            with open(self.path, "r+b") as file:
+                file.truncate(position)
+        self.columns = columns
+        self._header_changed = header_changed
+
+    def close(self):
+        """
+        Rewrite the header line if columns were added after the first DataFrame. Rows written before a column
+        was added are left one field short, which read_csv treats as missing values.
+
+        Returns
+        -------
+        None
+        """
+        if not self._header_changed:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            src.readline()
+            dst.write(pd.DataFrame(columns=self.columns).to_csv(index=False).encode("utf-8"))
+            shutil.copyfileobj(src, dst, 1048576)
+        os.replace(tmp_path, self.path)
+        self._header_changed = False
+
+
+def _append_reader(writer: _CategoryWriter,
+                   reader: "ChunkedReader",
+                   chunksize: int,
+                   dtype: dict or None = None):
+    """
+    Append a C&V extract to a consolidated file 'chunksize' rows at a time. Columns have the types 'safe_read'
+    gives when reading the whole file (see ChunkedReader), so the text written does not depend on where chunk
+    boundaries fall. If reading fails part way, everything appended from the file is discarded.
+
+    Parameters
+    ----------
+    writer: _CategoryWriter
+    reader: ChunkedReader
+    chunksize: int
+    dtype: dict, optional
+        Column types overriding those of the reader (see '_promoted_dtypes')
+
+    Returns
+    -------
+    None
+    """
+    checkpoint = writer.checkpoint()
+    try:
+        for chunk in reader.chunks(chunksize):
+            if dtype:
+                chunk = chunk.astype({k: v for k, v in dtype.items() if k in chunk.columns})
+            writer.append(chunk)
+    except Exception:
+        writer.restore(checkpoint)
+        raise
+
+
+def _promoted_dtypes(readers: list) -> dict:
+    """
+    Integer columns that pd.concat would convert to float when concatenating the given files, because the
+    column is float (or missing) in another file
+
+    Parameters
+    ----------
+    readers: list
+        ChunkedReader for each file
+
+    Returns
+    -------
+    dict
+        {column: "float64"}
+    """
+    dtypes = [reader._kwargs.get("dtype") or dict() for reader in readers]
+    columns = set([x for d in dtypes for x in d.keys()])
+    promoted = dict()
+    for col_name in columns:
+        kinds = set([d.get(col_name, "float64") for d in dtypes])
+        if kinds == {"int64", "float64"}:
+            promoted[col_name] = "float64"
+    return promoted
+
+
+def _append_file(writer: _CategoryWriter,
+                 path: str,
+                 chunksize: int or None = None):
+    """
+    Append a C&V extract to a consolidated file. If chunksize is given, the extract is read and appended
+    'chunksize' rows at a time, so at most one chunk is held in memory; otherwise the whole file is read with
+    'safe_read'.
+
+    Parameters
+    ----------
+    writer: _CategoryWriter
+    path: str
+    chunksize: int, optional
+
+    Returns
+    -------
+    None
+    """
+    if chunksize is None:
+        writer.append(safe_read(path))
+        return
+    _append_reader(writer, ChunkedReader(path, scan_chunksize=chunksize), chunksize)
+
+
+class ConsolidationWorkers:
+    """
+    Consolidate C&V extracts as they arrive. Each file passed to 'submit' is handed to a worker thread for
+    its category, which reads it and appends it to "<category>.csv" in 'write_path'. Rows are written in the
+    order files are submitted. Consolidated files are UTF-8 encoded and recorded as such in the encoding
+    sidecar of 'write_path'.
+
+    Parameters
+    ----------
+    write_path: str
+        Directory to write consolidated csv files too (created if it does not exist)
+    chunksize: int, optional
+        If given, each file is read and appended this many rows at a time (see 'consolidate'). Column types
+        are resolved per file: as files arrive one at a time, an integer column is not converted to float
+        because it is missing from a later file, as it would be by 'consolidate'.
+    """
+    def __init__(self,
+                 write_path: str,
+                 chunksize: int or None = None):
+        self.write_path = write_path
+        self.chunksize = chunksize
+        if not os.path.isdir(write_path):
+            os.makedirs(write_path)
+        self.errors = dict()
+        self._workers = dict()
+        self._lock = threading.Lock()
+
+    def _run(self,
+             category: str,
+             queue: Queue):
+        writer = _CategoryWriter(os.path.join(self.write_path, f"{category}.csv"))
+        while True:
+            path = queue.get()
+            if path is None:
+                break
+            try:
+                _append_file(writer, path, self.chunksize)
+            except Exception as e:
+                with self._lock:
+                    self.errors.setdefault(category, list()).append(f"Failed at {path}: {str(e)}")
+        writer.close()
+
+    def submit(self, path: str):
+        """
+        Queue a file for consolidation
+
+        Parameters
+        ----------
+        path: str
+            Path to a C&V extract
+
+        Returns
+        -------
+        None
+        """
+        category = _category(path)
+        if category not in self._workers:
+            queue = Queue()
+            worker = threading.Thread(target=self._run, args=(category, queue), daemon=True)
+            worker.start()
+            self._workers[category] = (queue, worker)
+        self._workers[category][0].put(path)
+
+    def close(self) -> dict:
+        """
+        Wait for all queued files to be consolidated
+
+        Returns
+        -------
+        dict
+            {category: [error messages]} for any files that could not be read
+        """
+        for queue, _ in self._workers.values():
+            queue.put(None)
+        for _, worker in self._workers.values():
+            worker.join()
+        record_encoding(self.write_path, [f"{k}.csv" for k in self._workers.keys()
+                                          if os.path.isfile(os.path.join(self.write_path, f"{k}.csv"))])
+        return self.errors
+
+
+def _split_files(read_path: str,
+                 files: list,
+                 jobs: int) -> list:
+    """
+    Split the files of a category into contiguous groups of roughly equal size, one group per worker. Only
+    categories larger than _SPLIT_BYTES are split.
+
+    Parameters
+    ----------
+    read_path: str
+    files: list
+    jobs: int
+
+    Returns
+    -------
+    list
+        List of lists of file names
+    """
+    sizes = [os.path.getsize(os.path.join(read_path, f)) for f in files]
+    n = min(jobs, len(files), math.ceil(sum(sizes) / _SPLIT_BYTES))
+    if n <= 1:
+        return [files]
+    target = sum(sizes) / n
+    groups, group, group_size = list(), list(), 0
+    for f, size in zip(files, sizes):
+        if group and group_size + size / 2 > target and len(groups) < n - 1:
+            groups.append(group)
+            group, group_size = list(), 0
+        group.append(f)
+        group_size += size
+    groups.append(group)
+    return groups
+
+
+def _consolidate_files(read_path: str,
+                       files: list,
+                       out_path: str,
+                       chunksize: int or None = None) -> list:
+    """
+    Consolidate a list of files into a single csv file
+
+    Parameters
+    ----------
+    read_path: str
+        Directory containing the files
+    files: list
+    out_path: str
+    chunksize: int, optional
+        See 'consolidate'
+
+    Returns
+    -------
+    list
+        Columns of the consolidated file
+    """
+    if chunksize is None:
+        df = pd.concat([safe_read(os.path.join(read_path, f)) for f in files])
+        df.to_csv(out_path, index=False, encoding="utf-8")
+        return list(df.columns)
+    readers = [ChunkedReader(os.path.join(read_path, f), scan_chunksize=chunksize) for f in files]
+    promoted = _promoted_dtypes(readers)
+    columns = list()
+    for reader in readers:
+        columns.extend([x for x in (reader._kwargs.get("dtype") or dict()).keys() if x not in columns])
+    writer = _CategoryWriter(out_path, columns)
+    for reader in readers:
+        _append_reader(writer, reader, chunksize, promoted)
+    writer.close()
+    return writer.columns
+
+
+def _merge_parts(parts: list,
+                 out_path: str):
+    """
+    Concatenate the consolidated parts of a single category, in order, and remove the parts. Parts whose
+    columns are a prefix of the combined columns are copied without parsing.
+
+    Parameters
+    ----------
+    parts: list
+        List of (path, columns) for each part
+    out_path: str
+
+    Returns
+    -------
+    None
+    """
+    columns = list()
+    for _, part_columns in parts:
+        columns.extend([x for x in part_columns if x not in columns])
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+        dst.write(pd.DataFrame(columns=columns).to_csv(index=False))
+        for path, part_columns in parts:
+            if part_columns == columns[:len(part_columns)]:
+                with open(path, "r", newline="", encoding="utf-8") as src:
+                    src.readline()
+                    shutil.copyfileobj(src, dst, 1048576)
+            else:
+                for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=100000):
+                    chunk.reindex(columns=columns, fill_value="").to_csv(dst, header=False, index=False)
+            os.remove(path)
+    os.replace(tmp_path, out_path)
+
+
+def _parse_dates(df: pd.DataFrame,
+                 datetime_cache: str or None = None) -> pd.DataFrame:
+    """
+    Parse the date/time columns (DATE_COLUMNS) of a C&V extract to datetime64 using 'parse_datetimes'.
+
+    Parameters
+    ----------
+    df: Pandas.DataFrame
+    datetime_cache: str, optional
+        Location of a persistent cache of parsed date/time strings (see CHADBuilder.datetime_cache)
+
+    Returns
+    -------
+    Pandas.DataFrame
+    """
+    cache = DatetimeCache(datetime_cache) if datetime_cache is not None else None
+    try:
+        for col_name in [x for x in DATE_COLUMNS if x in df.columns]:
+            if pd.api.types.is_datetime64_any_dtype(df[col_name]):
+                continue
+            df[col_name] = pd.to_datetime(parse_datetimes(df[col_name].values, cache=cache),
+                                          format="%Y-%m-%dT%H:%M:%SZ")
+    finally:
+        if cache is not None:
+            cache.close()
+    return df
+
+
+def _write_columnar(csv_path: str,
+                    columnar: str,
+                    datetime_cache: str or None = None) -> str:
+    """
+    Write a consolidated csv file in a columnar format alongside the original, with date/time columns parsed
+
+    Parameters
+    ----------
+    csv_path: str
+    columnar: str
+        "parquet" or "feather"
+    datetime_cache: str, optional
+        Location of a persistent cache of parsed date/time strings (see CHADBuilder.datetime_cache)
+
+    Returns
+    -------
+    str
+        Path of the columnar file
+    """
+    df = _parse_dates(safe_read(csv_path), datetime_cache)
+    for col_name in df.columns[df.dtypes == object]:
+        # Columns of mixed types cannot be stored in a columnar format
+        df[col_name] = df[col_name].where(df[col_name].isnull(), df[col_name].astype(str))
+    out_path = f"{os.path.splitext(csv_path)[0]}.{columnar}"
+    tmp_path = f"{out_path}.tmp"
+    if columnar == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _consolidate_columnar(paths: list,
+                          columnar: str,
+                          jobs: int = 1,
+                          datetime_cache: str or None = None):
+    """
+    Write columnar copies of consolidated csv files (see '_write_columnar'), warning of any failures
+
+    Parameters
+    ----------
+    paths: list
+    columnar: str
+    jobs: int, default=1
+    datetime_cache: str, optional
+
+    Returns
+    -------
+    None
+    """
+    print(f"Writing {columnar} files....")
+    if jobs <= 1:
+        for path in tqdm(paths):
+            try:
+                _write_columnar(path, columnar, datetime_cache)
+            except Exception as e:
+                print(f"Failed to write {columnar} for {path}: {str(e)}")
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_write_columnar, path, columnar, datetime_cache): path for path in paths}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to write {columnar} for {futures[future]}: {str(e)}")
 
 
 def consolidate(read_path: str,
-                write_path: str):
+                write_path: str,
+                chunksize: int or None = None,
+                jobs: int = 1,
+                columnar: str or None = None,
+                datetime_cache: str or None = None) -> dict:
     """
     Given a directory containing C&V extracts, generate consolidated csv files stored in 'write_path'.
     Files consolidated by file category.
@@ -112,17 +1077,77 @@ def consolidate(read_path: str,
         Directory containing original csv files
     write_path: str
         Directory to write new consolidated csv files too
+    chunksize: int, optional
+        If given, consolidate in streaming mode: each file is read 'chunksize' rows at a time and appended to
+        the consolidated file, so memory use is bounded by the chunk size rather than the size of the category.
+        Column types are resolved by a first pass over each file (see ChunkedReader), so the consolidated file
+        is the same as in memory, with columns ordered and typed as they would be by pd.concat. If None, each
+        category is read in full and concatenated in memory.
+    jobs: int, default=1
+        Number of worker processes. Categories are consolidated in parallel and categories larger than
+        256MB are additionally split across workers and merged once all their parts are complete.
+    columnar: str, optional
+        Also write each consolidated file as "parquet" or "feather" (requires pyarrow), with the date/time
+        columns (DATE_COLUMNS) stored parsed. Populate reads these in preference to csv files.
+    datetime_cache: str, optional
+        Location of a persistent cache of parsed date/time strings (see CHADBuilder.datetime_cache) used when
+        writing columnar files; can be shared with Populate
     Returns
     -------
-    None
+    dict
+        {category: error message} for any category that could not be consolidated. No consolidated file is
+        written for these categories; all other categories are unaffected. Consolidated files are UTF-8
+        encoded and recorded as such in the encoding sidecar (ENCODING_SIDECAR) of the consolidated directory,
+        so reading them with 'safe_read' requires no encoding detection.
     """
+    if columnar is not None and columnar not in COLUMNAR_FORMATS:
+        raise ValueError(f"columnar must be one of {COLUMNAR_FORMATS}")
     write_path = os.path.join(write_path, "consolidated")
     if not os.path.isdir(write_path):
         os.mkdir(write_path)
     categories = _unique_categories(read_path)
-    files = [f for f in os.listdir(read_path) if os.path.isfile(os.path.join(read_path, f))]
-    categories = {k: [f for f in files if f.split("-")[0] == k] for k in categories}
-    for k, files in tqdm(categories.items()):
-        dataframes = [safe_read(os.path.join(read_path, f)) for f in files]
-        dataframes = pd.concat(dataframes)
-        dataframes.to_csv(os.path.join(write_path, f"{k}.csv"), index=False)
+    files = _extract_files(read_path)
+    categories = {k: [f for f in files if _category(f) == k] for k in categories}
+    tasks = list()
+    for k, files in categories.items():
+        out_path = os.path.join(write_path, f"{k}.csv")
+        groups = _split_files(read_path, files, jobs)
+        if len(groups) == 1:
+            tasks.append((k, groups[0], out_path))
+        else:
+            tasks.extend([(k, group, f"{out_path}.part{i}") for i, group in enumerate(groups)])
+    columns, errors = dict(), dict()
+    if jobs <= 1:
+        for k, files, out_path in tqdm(tasks):
+            try:
+                columns[out_path] = _consolidate_files(read_path, files, out_path, chunksize)
+            except Exception as e:
+                errors[k] = str(e)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_consolidate_files, read_path, files, out_path, chunksize): (k, out_path)
+                       for k, files, out_path in tasks}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                k, out_path = futures[future]
+                try:
+                    columns[out_path] = future.result()
+                except Exception as e:
+                    errors.setdefault(k, str(e))
+    for k in categories.keys():
+        out_path = os.path.join(write_path, f"{k}.csv")
+        parts = [x[2] for x in tasks if x[0] == k and x[2] != out_path]
+        if k in errors:
+            for path in parts + [out_path]:
+                if os.path.isfile(path):
+                    os.remove(path)
+            print(f"Failed to consolidate {k}: {errors[k]}")
+            continue
+        if parts:
+            _merge_parts([(x, columns[x]) for x in parts], out_path)
+    record_encoding(write_path, [f"{k}.csv" for k in categories.keys() if k not in errors])
+    if columnar is not None:
+        _consolidate_columnar([os.path.join(write_path, f"{k}.csv") for k in categories.keys() if k not in errors],
+                              columnar,
+                              jobs,
+                              datetime_cache)
+    return errors
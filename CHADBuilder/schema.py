@@ -54,6 +54,15 @@ def _schema():
             valid INTEGER DEFAULT 1
             );
         """
+    path_summary = """
+            CREATE TABLE PathologySummary(
+            test_category TEXT,
+            test_name TEXT,
+            total INTEGER,
+            empty INTEGER,
+            dropped INTEGER DEFAULT 0
+            );
+        """
     micro = """
             CREATE TABLE Microbiology(
             patient_id TEXT,
@@ -139,6 +148,7 @@ def _schema():
             comorbid,
             radiology,
             path,
+            path_summary,
             micro,
             haem,
             units]
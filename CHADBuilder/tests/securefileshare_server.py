@@ -0,0 +1,321 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import threading
+import random
+import json
+import time
+import re
+
+CATEGORIES = ["FBC", "LFT", "CRP", "UandE", "Covid19"]
+
+
+def _file_content(idx: int,
+                  size: int) -> bytes:
+    """
+    Deterministic csv content of roughly 'size' bytes for the file at the given index
+
+    Parameters
+    ----------
+    idx: int
+    size: int
+
+    Returns
+    -------
+    bytes
+    """
+    rows = ["PATIENT_ID,REQUEST_LOCATION,TEST_DATE,TAKEN_DATE,RESULT"]
+    length = len(rows[0]) + 1
+    i = 0
+    while length < size:
+        row = f"{idx:05d}{i:07d},WARD{i % 13},0{1 + i % 9}/03/2020 1{i % 10}:30,0{1 + i % 9}/03/2020 09:15,{i % 97}"
+        rows.append(row)
+        length += len(row) + 1
+        i += 1
+    return ("\n".join(rows) + "\n").encode("utf-8")
+
+
+class SecureFileShareStub:
+    """
+    Local HTTP stand-in for the securefileshare API used by CHADBuilder.fetch_data. Implements
+    "/api/v1/token" (password and refresh_token grants), the paged "/api/v1/folders/{id}/files" listing and
+    "/api/v1/folders/{id}/files/{file_id}/download" (with HTTP Range support). Latency, errors, token expiry
+    and dropped connections can be injected to exercise the retry logic. Served requests and injected faults
+    are counted in 'counters'.
+
+    Parameters
+    ----------
+    n_files: int, default=50
+        Number of files in the folder
+    file_size: int, default=65536
+        Approximate size of each file in bytes
+    page_size: int, default=20
+        Number of files listed per page
+    latency: float, default=0
+        Delay in seconds added to every response
+    error_rate: float, default=0
+        Probability of responding to a listing or download request with 500 Internal Server Error
+    unauthorized_rate: float, default=0
+        Probability of responding to a listing or download request with 401 regardless of the token
+    truncate_rate: float, default=0
+        Probability of closing the connection half way through a download
+    token_lifetime: float, default=3600
+        Seconds until an issued access token expires
+    folder_id: str, default="662104718"
+    seed: int, default=42
+        Seed for fault injection
+    """
+    def __init__(self,
+                 n_files: int = 50,
+                 file_size: int = 65536,
+                 page_size: int = 20,
+                 latency: float = 0.,
+                 error_rate: float = 0.,
+                 unauthorized_rate: float = 0.,
+                 truncate_rate: float = 0.,
+                 token_lifetime: float = 3600.,
+                 folder_id: str = "662104718",
+                 seed: int = 42):
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.truncate_rate = truncate_rate
+        self.token_lifetime = token_lifetime
+        self.folder_id = folder_id
+        self.username = "user"
+        self.password = "password"
+        self.files = {str(1000 + i): {"id": str(1000 + i),
+                                      "name": f"{CATEGORIES[i % len(CATEGORIES)]}-{i:04d}",
+                                      "content": _file_content(i, file_size),
+                                      "modified": "2020-10-01T00:00:00Z"}
+                      for i in range(n_files)}
+        self.counters = {"token": 0, "refresh": 0, "pages": 0, "downloads": 0, "bytes": 0,
+                         "server_errors": 0, "unauthorized": 0, "expired": 0, "truncated": 0}
+        self._tokens = dict()
+        self._refresh_tokens = set()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = None
+        self._thread = None
+
+    @property
+    def filehost(self) -> str:
+        """
+        Base URL to pass as 'filehost' to the functions of CHADBuilder.fetch_data
+
+        Returns
+        -------
+        str
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def retries(self) -> int:
+        """
+        Number of faulty responses served, each of which costs the client a retry
+
+        Returns
+        -------
+        int
+        """
+        return sum(self.counters[x] for x in ["server_errors", "unauthorized", "expired", "truncated"])
+
+    def write_credentials(self, path: str):
+        """
+        Write a login file accepted by CHADBuilder.fetch_data.get_credentials
+
+        Parameters
+        ----------
+        path: str
+
+        Returns
+        -------
+        None
+        """
+        with open(path, "w") as file:
+            file.write(f"{self.username}\n{self.password}\n")
+
+    def listing(self) -> list:
+        """
+        Page content for every file, as returned in "items" by the listing endpoint
+
+        Returns
+        -------
+        list
+        """
+        return [{"id": x["id"], "name": x["name"], "size": len(x["content"]), "modified": x["modified"]}
+                for x in self.files.values()]
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _chance(self, rate: float) -> bool:
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _issue_token(self) -> dict:
+        with self._lock:
+            access_token = "".join(self._random.choice("abcdef0123456789") for _ in range(32))
+            refresh_token = "".join(self._random.choice("abcdef0123456789") for _ in range(32))
+            self._tokens[access_token] = time.monotonic() + self.token_lifetime
+            self._refresh_tokens.add(refresh_token)
+        return {"access_token": access_token,
+                "token_type": "bearer",
+                "expires_in": self.token_lifetime,
+                "refresh_token": refresh_token}
+
+    def _authorized(self, header: str or None) -> bool:
+        token = (header or "").replace("Bearer ", "")
+        with self._lock:
+            expires_at = self._tokens.get(token)
+        if expires_at is None:
+            self._count("unauthorized")
+            return False
+        if time.monotonic() >= expires_at:
+            self._count("expired")
+            return False
+        return True
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, body: dict):
+                content = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _fault(self) -> bool:
+                if stub._chance(stub.error_rate):
+                    stub._count("server_errors")
+                    self._json(500, {"message": "Internal Server Error"})
+                    return True
+                if stub._chance(stub.unauthorized_rate):
+                    stub._count("unauthorized")
+                    self._json(401, {"message": "Authorization has been denied for this request."})
+                    return True
+                if not stub._authorized(self.headers.get("Authorization")):
+                    self._json(401, {"message": "Authorization has been denied for this request."})
+                    return True
+                return False
+
+            def do_POST(self):
+                time.sleep(stub.latency)
+                length = int(self.headers.get("Content-Length", 0))
+                data = parse_qs(self.rfile.read(length).decode("utf-8"))
+                grant = data.get("grant_type", [None])[0]
+                if self.path != "/api/v1/token":
+                    return self._json(404, {"message": "Not Found"})
+                if grant == "password":
+                    if data.get("username", [None])[0] != stub.username or \
+                            data.get("password", [None])[0] != stub.password:
+                        return self._json(400, {"error": "invalid_grant"})
+                    stub._count("token")
+                    return self._json(200, stub._issue_token())
+                if grant == "refresh_token":
+                    with stub._lock:
+                        valid = data.get("refresh_token", [None])[0] in stub._refresh_tokens
+                    if not valid:
+                        return self._json(400, {"error": "invalid_grant"})
+                    stub._count("refresh")
+                    return self._json(200, stub._issue_token())
+                return self._json(400, {"error": "unsupported_grant_type"})
+
+            def do_GET(self):
+                time.sleep(stub.latency)
+                url = urlparse(self.path)
+                listing = re.match(rf"^/api/v1/folders/{stub.folder_id}/files$", url.path)
+                download = re.match(rf"^/api/v1/folders/{stub.folder_id}/files/(\w+)/download$", url.path)
+                if listing is None and download is None:
+                    return self._json(404, {"message": "Not Found"})
+                if self._fault():
+                    return
+                if listing is not None:
+                    return self._listing(int(parse_qs(url.query).get("page", ["1"])[0]))
+                return self._download(download.group(1))
+
+            def _listing(self, page: int):
+                stub._count("pages")
+                items = stub.listing()
+                total_pages = max(1, -(-len(items) // stub.page_size))
+                items = items[(page - 1) * stub.page_size:page * stub.page_size]
+                self._json(200, {"items": items,
+                                 "paging": {"page": page, "totalPages": total_pages}})
+
+            def _download(self, file_id: str):
+                file = stub.files.get(file_id)
+                if file is None:
+                    return self._json(404, {"message": "Not Found"})
+                content = file["content"]
+                start = 0
+                match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if match is not None:
+                    start = int(match.group(1))
+                    if start >= len(content):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+                else:
+                    self.send_response(200)
+                body = content[start:]
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                stub._count("downloads")
+                if len(body) > 1 and stub._chance(stub.truncate_rate):
+                    stub._count("truncated")
+                    body = body[:len(body) // 2]
+                    self.close_connection = True
+                self.wfile.write(body)
+                stub._count("bytes", len(body))
+
+        return Handler
+
+    def start(self):
+        """
+        Start serving on a free local port in a background thread
+
+        Returns
+        -------
+        SecureFileShareStub
+        """
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the server
+
+        Returns
+        -------
+        None
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
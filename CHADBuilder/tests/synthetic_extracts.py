@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import sqlite3
+import os
+
+DATE_FORMATS = ["%d/%m/%Y %H:%M", "%d-%m-%Y", "%d.%m.%Y %H:%M:%S", "%d/%m/%Y"]
+PATH_FILES = ["FBC", "CRP"]
+MICRO_TEXT = {"AsperELISA": ["Specimen received: Serum Aspergillus ELISA Aspergillus Antigen (Galactomannan) "
+                             "Not detected", "Issue with result"],
+              "AsperPCR": ["Specimen received: Blood Aspergillus PCR PCR DNA Not Detected",
+                           "Specimen received: BAL Aspergillus PCR PCR DNA  Detected"],
+              "BCult": ["Specimen received: Blood culture Culture No growth",
+                        "Specimen received: Blood (Peripheral) Microscopy- Gram positive cocci"],
+              "BGluc": ["Specimen received: Serum Mycology reference unit Cardiff Beta Glucan Antigen Test : "
+                        "<31 pg/ml"],
+              "RESPL": ["Specimen received: Nose swab RESPL Influenza A: Not detected",
+                        "Specimen received: Throat Microbiological investigation of respiratory viruses RSV "
+                        "(detected)"]}
+COMORBIDITIES = ["SOLIDORGANTRANSPLANT", "CANCER", "SEVERERESPIRATORY", "SEVERESINGLEORGANDISEASE",
+                 "RAREDISEASES", "IMMUNOSUPPRESSION", "PREGNANCYWITHCONGHEARTDIS", "GPIDENTIFIED_PATIENTS",
+                 "RENAL_DIALYSIS", "OTHER"]
+
+
+def write_extracts(path: str,
+                   n: int = 60,
+                   seed: int = 0) -> dict:
+    """
+    Write a small set of synthetic consolidated C&V extracts, with the columns expected by
+    CHADBuilder.populate.Populate
+
+    Parameters
+    ----------
+    path: str
+        Directory the csv files are written to
+    n: int, default=60
+        Rows per extract
+    seed: int, default=0
+
+    Returns
+    -------
+    dict
+        Keyword arguments for Populate naming the Pathology and Microbiology extracts written (the other
+        extracts use the default names)
+    """
+    rng = np.random.default_rng(seed)
+    patients = [f"P{i:05d}" for i in range(n // 2)]
+
+    def dates(k: int) -> list:
+        minutes = pd.Timestamp("2020-03-01") + pd.to_timedelta(rng.integers(0, 200 * 24 * 60, k), unit="m")
+        values = [x.strftime(DATE_FORMATS[rng.integers(0, len(DATE_FORMATS))]) for x in minutes]
+        for i in rng.choice(k, max(1, k // 10), replace=False):
+            values[i] = None
+        return values
+
+    def results(k: int) -> dict:
+        return {"PATIENT_ID": rng.choice(patients, k),
+                "REQUEST_LOCATION": rng.choice(["WARD1", "ICU"], k),
+                "TEST_DATE": dates(k),
+                "TAKEN_DATE": dates(k),
+                "AGE": rng.integers(18, 99, k),
+                "GENDER": rng.choice(["M", "F"], k),
+                "ADMISSION_DATE": dates(k)}
+
+    for file in PATH_FILES:
+        df = results(n)
+        for analyte in ["A1", "A2", "A3"]:
+            df[f"{file}_{analyte}"] = rng.choice(["1.5", "2", "Issue with result", "<5"], n).astype(object)
+        # A3 is never measured in the first half of the panel, A2 is never measured at all
+        df[f"{file}_A2"] = None
+        df[f"{file}_A3"][:n // 2] = None
+        pd.DataFrame(df).to_csv(os.path.join(path, f"{file}.csv"), index=False)
+    texts = dict(MICRO_TEXT, XRChest=["Normal chest", "Consolidation"], CTangio=["No PE", "PE present"],
+                 CompAlt=["alt text"], CompClass=["class text"], Covid19=["Positive", "Negative", "In Progress"])
+    for file, text in texts.items():
+        df = results(n)
+        df["TEXT"] = rng.choice(text, n)
+        pd.DataFrame(df).to_csv(os.path.join(path, f"{file}.csv"), index=False)
+    df = results(n)
+    for x in COMORBIDITIES:
+        df[x] = rng.integers(0, 2, n)
+    pd.DataFrame(df).to_csv(os.path.join(path, "CoMorbid.csv"), index=False)
+    pd.DataFrame({"PATIENT_ID": patients, "AGE": rng.integers(18, 99, len(patients)),
+                  "GENDER": rng.choice(["M", "F", "U"], len(patients)), "WIMD": rng.random(len(patients)),
+                  "DATE_FROM": dates(len(patients)), "DATE_ENTERED": dates(len(patients)),
+                  "TEST_PATIENT": "N"}).to_csv(os.path.join(path, "People.csv"), index=False)
+    pd.DataFrame({"PATIENT_ID": rng.choice(patients, n), "WIMD": rng.random(n), "GENDER": rng.choice(["M", "F"], n),
+                  "COMPONENT": rng.choice(["AE", "IP"], n), "EVENT_TYPE": rng.choice(["Admission", "Discharge"], n),
+                  "EVENT_DATE": [x or "01/04/2020" for x in dates(n)], "COVID_STATUS": rng.choice(["P", "N"], n),
+                  "SOURCE_TYPE": rng.choice(["a", "b"], n), "SOURCE": rng.choice(["home", "gp"], n),
+                  "DESTINATION": rng.choice(["Died In Dept.", "Discharged home", "Transfer"], n),
+                  "CRITICAL_CARE": rng.integers(0, 2, n)}).to_csv(os.path.join(path, "Outcomes.csv"), index=False)
+    k = n // 5
+    pd.DataFrame({"PATIENT_ID": rng.choice(patients, k), "REQUEST_LOCATION": "ICU", "UNIT": rng.choice(["U1", "U2"], k),
+                  "UNIT_OUTCOME": rng.choice(["A", "D"], k), "HOSP_OUTCOME": rng.choice(["A", "D"], k),
+                  "HEIGHT": rng.integers(150, 190, k), "WEIGHT": rng.integers(50, 120, k),
+                  "AP2": rng.integers(0, 40, k), "ETHNICITY": rng.choice(["A", "B"], k),
+                  "RENALRT": rng.integers(0, 2, k), "RADIOTHERAPY": rng.integers(0, 2, k),
+                  "UNIT_ADMIT_DATE": dates(k), "UNIT_DISCH_DATE": dates(k),
+                  "MECHANICALVENTILATION": rng.integers(0, 2, k), "DAYSVENTILATED": rng.integers(0, 20, k),
+                  "COVID19_STATUS": rng.choice(["P", "N"], k)}).to_csv(os.path.join(path, "CritCare.csv"), index=False)
+    pd.DataFrame({"test_name": ["FBC_A1", "CRP_A1"],
+                  "reported_units": ["g/L", "mg/L"]}).to_csv(os.path.join(path, "TestUnits.csv"), index=False)
+    return {"path_files": PATH_FILES,
+            "micro_files": list(MICRO_TEXT.keys())}
+
+
+def read_tables(database_path: str) -> dict:
+    """
+    Every table of a database as a DataFrame of strings (missing values kept), sorted so that tables built in
+    a different order compare equal
+
+    Parameters
+    ----------
+    database_path: str
+
+    Returns
+    -------
+    dict
+    """
+    connection = sqlite3.connect(database_path)
+    tables = dict()
+    for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+        df = pd.read_sql(f"SELECT * FROM {name}", connection).astype(str)
+        tables[name] = df.sort_values(list(df.columns)).reset_index(drop=True)
+    connection.close()
+    return tables
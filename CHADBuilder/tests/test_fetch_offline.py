@@ -0,0 +1,169 @@
+from ..fetch_data import get_pages, get_files, TokenProvider, _download, _part_path
+from ..process_data import consolidate, clean_complex_text
+from ..pipeline import fetch_and_consolidate
+from ..manifest import Manifest
+from .securefileshare_server import SecureFileShareStub
+import pandas as pd
+import tempfile
+import unittest
+import os
+
+
+class TestFetchOffline(unittest.TestCase):
+
+    def _provider(self, stub: SecureFileShareStub, tmp: str, **kwargs):
+        stub.write_credentials(os.path.join(tmp, "login.txt"))
+        return TokenProvider(stub.filehost, credentials_path=os.path.join(tmp, "login.txt"), **kwargs)
+
+    def _assert_downloaded(self, stub: SecureFileShareStub, output_dir: str):
+        for file in stub.files.values():
+            with open(os.path.join(output_dir, f"{file['name']}.csv"), "rb") as local:
+                self.assertEqual(local.read(), file["content"])
+        self.assertFalse([f for f in os.listdir(output_dir) if f.endswith(".part")])
+
+    def test_get_pages(self):
+        with SecureFileShareStub(n_files=45, page_size=10) as stub, tempfile.TemporaryDirectory() as tmp:
+            pages = get_pages(filehost=stub.filehost, token_provider=self._provider(stub, tmp))
+            self.assertEqual(list(pages.keys()), [1, 2, 3, 4, 5])
+            self.assertEqual(sum(len(x) for x in pages.values()), 45)
+
+    def test_get_files_serial_and_concurrent(self):
+        for workers in [1, 4]:
+            with SecureFileShareStub(n_files=12, page_size=5) as stub, tempfile.TemporaryDirectory() as tmp:
+                provider = self._provider(stub, tmp)
+                pages = get_pages(filehost=stub.filehost, token_provider=provider)
+                output_dir = os.path.join(tmp, "data")
+                os.mkdir(output_dir)
+                get_files(pages, output_dir=output_dir, filehost=stub.filehost, token_provider=provider,
+                          workers=workers)
+                self._assert_downloaded(stub, output_dir)
+                self.assertEqual(stub.counters["downloads"], 12)
+
+    def test_get_files_faults(self):
+        with SecureFileShareStub(n_files=10, error_rate=0.2, truncate_rate=0.2) as stub, \
+                tempfile.TemporaryDirectory() as tmp:
+            provider = self._provider(stub, tmp)
+            pages = get_pages(filehost=stub.filehost, token_provider=provider, sleep=0.01, max_repeats=20)
+            get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider,
+                      sleep=0.01, max_repeats=20, workers=3)
+            self._assert_downloaded(stub, tmp)
+            self.assertTrue(stub.retries > 0)
+
+    def test_resume_partial_download(self):
+        with SecureFileShareStub(n_files=1) as stub, tempfile.TemporaryDirectory() as tmp:
+            file = list(stub.files.values())[0]
+            with open(os.path.join(tmp, f"{file['name']}.csv.part"), "wb") as part:
+                part.write(file["content"][:1000])
+            endpoint = f"{stub.filehost}/api/v1/folders/{stub.folder_id}/files/{file['id']}/download"
+            _download(self._provider(stub, tmp), endpoint, file["name"], tmp)
+            self._assert_downloaded(stub, tmp)
+            self.assertEqual(stub.counters["bytes"], len(file["content"]) - 1000)
+
+    def test_stale_partial_download(self):
+        with SecureFileShareStub(n_files=1) as stub, tempfile.TemporaryDirectory() as tmp:
+            file = list(stub.files.values())[0]
+            write_path = os.path.join(tmp, f"{file['name']}.csv")
+            endpoint = f"{stub.filehost}/api/v1/folders/{stub.folder_id}/files/{file['id']}/download"
+            # Partial download of an earlier version of the file
+            with open(_part_path(write_path, "2020-09-01T00:00:00Z"), "wb") as part:
+                part.write(b"x" * 1000)
+            _download(self._provider(stub, tmp), endpoint, file["name"], tmp, size=len(file["content"]),
+                      modified=file["modified"])
+            self._assert_downloaded(stub, tmp)
+            self.assertEqual(stub.counters["bytes"], len(file["content"]))
+            # The file changed after it was listed, so the size reported by the server does not match
+            os.remove(write_path)
+            with open(_part_path(write_path, file["modified"]), "wb") as part:
+                part.write(b"x" * 1000)
+            _download(self._provider(stub, tmp), endpoint, file["name"], tmp, sleep=0,
+                      size=len(file["content"]) + 10, modified=file["modified"])
+            self._assert_downloaded(stub, tmp)
+            # The range request is rejected and the file downloaded again from the beginning
+            self.assertEqual(stub.counters["downloads"], 3)
+
+    def test_token_refresh(self):
+        with SecureFileShareStub(n_files=6, page_size=1, latency=0.05, token_lifetime=1.) as stub, \
+                tempfile.TemporaryDirectory() as tmp:
+            provider = self._provider(stub, tmp, refresh_margin=0.9)
+            get_pages(filehost=stub.filehost, token_provider=provider)
+            self.assertTrue(stub.counters["refresh"] > 0)
+            self.assertEqual(stub.counters["token"], 1)
+            self.assertEqual(stub.counters["expired"], 0)
+
+    def test_manifest(self):
+        with SecureFileShareStub(n_files=5) as stub, tempfile.TemporaryDirectory() as tmp:
+            provider = self._provider(stub, tmp)
+            pages = {1: stub.listing()}
+            get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider)
+            plan = get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider,
+                             dry_run=True)
+            self.assertEqual(len(plan["unchanged"]), 5)
+            files = list(stub.files.values())
+            with open(os.path.join(tmp, f"{files[0]['name']}.csv"), "ab") as corrupt:
+                corrupt.write(b"garbage")
+            os.remove(os.path.join(tmp, f"{files[1]['name']}.csv"))
+            files[2]["modified"] = "2020-11-01T00:00:00Z"
+            pages = {1: stub.listing()}
+            plan = get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider,
+                             dry_run=True)
+            self.assertEqual(len(plan["corrupt"]), 2)
+            self.assertEqual(len(plan["changed"]), 1)
+            get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider)
+            self._assert_downloaded(stub, tmp)
+            self.assertEqual(stub.counters["downloads"], 8)
+
+    def test_manifest_adopts_without_size(self):
+        with SecureFileShareStub(n_files=3) as stub, tempfile.TemporaryDirectory() as tmp:
+            files = list(stub.files.values())
+            for file in files[:2]:
+                with open(os.path.join(tmp, f"{file['name']}.csv"), "wb") as local:
+                    local.write(file["content"])
+            open(os.path.join(tmp, f"{files[2]['name']}.csv"), "wb").close()
+            manifest = Manifest(os.path.join(tmp, ".manifest.json"))
+            with self.assertWarns(UserWarning):
+                plan = manifest.plan([{"id": x["id"], "name": x["name"]} for x in files], tmp)
+            self.assertEqual([x["name"] for x in plan["unchanged"]], [x["name"] for x in files[:2]])
+            self.assertEqual([x["name"] for x in plan["new"]], [files[2]["name"]])
+            entry = manifest.files[files[0]["id"]]
+            self.assertEqual(entry["local_size"], len(files[0]["content"]))
+            self.assertIsNone(entry["size"])
+            # Fields the manifest did not record are not compared
+            plan = manifest.plan(stub.listing(), tmp)
+            self.assertEqual([x["name"] for x in plan["unchanged"]], [x["name"] for x in files[:2]])
+
+    def test_manifest_after_cleaning(self):
+        with SecureFileShareStub(n_files=4) as stub, tempfile.TemporaryDirectory() as tmp:
+            provider = self._provider(stub, tmp)
+            files = list(stub.files.values())
+            files[0]["content"] = b'PATIENT_ID,TEXT\na,"Result \\\\ ""pending"""\nb,Negative\n'
+            pages = {1: stub.listing()}
+            get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider)
+            clean_complex_text(tmp)
+            with open(os.path.join(tmp, f"{files[0]['name']}.csv"), "rb") as cleaned:
+                self.assertEqual(cleaned.read(), b"PATIENT_ID,TEXT\r\na,Result  pending\r\nb,Negative\r\n")
+            plan = get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider,
+                             dry_run=True, verify_checksums=True)
+            self.assertEqual(len(plan["unchanged"]), 4)
+            self.assertEqual(stub.counters["downloads"], 4)
+
+    def test_fetch_and_consolidate(self):
+        with SecureFileShareStub(n_files=12, file_size=4096) as stub, tempfile.TemporaryDirectory() as tmp:
+            provider = self._provider(stub, tmp)
+            output_dir = os.path.join(tmp, "data")
+            os.mkdir(output_dir)
+            pages = {1: stub.listing()[:6], 2: stub.listing()[6:]}
+            get_files({1: pages[1]}, output_dir=output_dir, filehost=stub.filehost, token_provider=provider)
+            errors = fetch_and_consolidate(pages, output_dir=output_dir, write_path=os.path.join(tmp, "pipeline"),
+                                           filehost=stub.filehost, token_provider=provider, workers=3)
+            self.assertEqual(errors, dict())
+            os.mkdir(os.path.join(tmp, "serial"))
+            consolidate(output_dir, os.path.join(tmp, "serial"))
+            serial = sorted(os.listdir(os.path.join(tmp, "serial", "consolidated")))
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp, "pipeline", "consolidated"))), serial)
+            serial = [x for x in serial if x.endswith(".csv")]
+            for file in serial:
+                expected = pd.read_csv(os.path.join(tmp, "serial", "consolidated", file))
+                result = pd.read_csv(os.path.join(tmp, "pipeline", "consolidated", file))
+                sort = list(expected.columns)
+                pd.testing.assert_frame_equal(expected.sort_values(sort).reset_index(drop=True),
+                                              result.sort_values(sort).reset_index(drop=True))
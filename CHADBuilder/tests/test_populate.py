@@ -0,0 +1,284 @@
+from ..populate import search_covid_results, summarise_covid_results, register_deaths, extract_group, \
+    _re_search_df, _records, _stage_groups, MICRO_PATTERNS, Populate, Stage, STAGES, build_indexes, INDEXES, \
+    BUILD_PRAGMAS
+from ..schema import create_database
+from .. import populate
+from .synthetic_extracts import write_extracts, read_tables
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from unittest import mock
+import pandas as pd
+import sqlite3
+import numpy as np
+import tempfile
+import unittest
+import os
+
+
+class TestCovidStatus(unittest.TestCase):
+
+    def test_matches_search_covid_results(self):
+        rng = np.random.default_rng(42)
+        n = 400
+        dates = pd.Series(pd.date_range("2020-03-01", periods=60, freq="13h"))
+        covid = pd.DataFrame({"PATIENT_ID": rng.choice([f"p{i}" for i in range(80)], n),
+                              "TEXT": rng.choice(["Positive", "Negative", "In Progress", None], n),
+                              "collection_datetime": dates.sample(n, replace=True, random_state=1).values,
+                              "test_datetime": dates.sample(n, replace=True, random_state=2).values})
+        covid.loc[rng.random(n) < 0.3, "collection_datetime"] = pd.NaT
+        covid.loc[rng.random(n) < 0.3, "test_datetime"] = pd.NaT
+        # Patients whose positives all lack a collection datetime, with and without a test datetime
+        covid.loc[covid.PATIENT_ID == "p0", ["TEXT", "collection_datetime"]] = ["Positive", pd.NaT]
+        covid.loc[covid.PATIENT_ID == "p1", ["TEXT", "collection_datetime", "test_datetime"]] = \
+            ["Positive", pd.NaT, pd.NaT]
+        covid.loc[covid.PATIENT_ID == "p2", "TEXT"] = "In Progress"
+        covid = covid[~covid.PATIENT_ID.isin(["p3"])]
+        covid.loc[covid.PATIENT_ID == "p4", "test_datetime"] = covid.loc[covid.PATIENT_ID == "p4",
+                                                                         "collection_datetime"]
+        summary = summarise_covid_results(covid)
+        for patient_id in [f"p{i}" for i in range(80)]:
+            expected = search_covid_results(patient_id, covid)
+            if patient_id in summary.index:
+                result = tuple(summary.loc[patient_id, ["covid_status", "covid_date_first_positive"]])
+            else:
+                result = ("U", None)
+            self.assertEqual(result, expected, patient_id)
+
+
+class TestRegisterDeaths(unittest.TestCase):
+
+    def test_register_deaths(self):
+        events = pd.DataFrame({"PATIENT_ID": ["a", "a", "b", "c", None, "d"],
+                               "DESTINATION": ["Home", "Died In Dept.", "Home", None, "Died In Dept.",
+                                               "Died - USUAL PLACE OF RESIDENCE"]})
+        patient_ids = pd.Series(["a", "b", "c", "a", "e", "d"])
+        self.assertEqual(list(register_deaths(patient_ids, events, ["Died In Dept.",
+                                                                     "Died - USUAL PLACE OF RESIDENCE"])),
+                         [1, 0, 0, 1, 0, 1])
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_records_match_to_sql(self):
+        df = pd.DataFrame({"a": ["x", None, "z"],
+                           "b": [1.5, np.nan, 3.],
+                           "c": [1, 2, 3],
+                           "d": pd.Categorical(["u", "v", None]),
+                           "e": pd.to_datetime(["2020-03-01 10:00", None, "2020-03-02 00:00"])})
+        self.assertEqual(_records(df), [("x", 1.5, 1, "u", "2020-03-01 10:00:00"),
+                                        (None, None, 2, "v", None),
+                                        ("z", 3., 3, None, "2020-03-02 00:00:00")])
+        self.assertEqual([type(x) for x in _records(df)[0]], [str, float, int, str, str])
+
+
+class TestExtractGroup(unittest.TestCase):
+
+    def test_matches_re_search_df(self):
+        values = ["Specimen received: Serum Aspergillus ELISA Aspergillus Antigen (Galactomannan) Not detected",
+                  "Specimen received: BAL Aspergillus PCR PCR DNA Not Detected",
+                  "Specimen received: Blood Culture Culture No growth after 5 days",
+                  "Specimen received:Blood (Left arm) Microscopy- Gram positive cocci",
+                  "Specimen received: Serum Mycology reference unit Cardiff Beta Glucan Antigen Test : <7 pg/mL",
+                  "Specimen received: Nose/throat swab RESPL Influenza A: Not detected",
+                  "Specimen received: Sputum Microbiological investigation of respiratory viruses (RSV): Detected",
+                  "Specimen received: \u00e9chantillon Culture r\u00e9sultat", "", "No specimen"]
+        for sample_type_pattern, result_pattern in MICRO_PATTERNS.values():
+            for pattern, group_idx in [(sample_type_pattern, 0), (result_pattern, 1)]:
+                expected = [_re_search_df(pattern.pattern, x, group_idx) for x in values]
+                self.assertEqual(extract_group(values, pattern, group_idx), expected)
+        self.assertEqual(extract_group([None, np.nan], MICRO_PATTERNS["BCult"][0]), [None, None])
+
+
+class TestSourceCache(unittest.TestCase):
+
+    def test_sources_read_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pd.DataFrame({"PATIENT_ID": ["a", "b"], "DESTINATION": ["Home", "Died In Dept."],
+                          "EVENT_DATE": ["01/03/2020", "02/03/2020 10:30"]}).to_csv(os.path.join(tmp, "Outcomes.csv"),
+                                                                                   index=False)
+            pop = Populate(database_path=os.path.join(tmp, "test.db"), data_path=tmp, verbose=False,
+                           path_files=[], micro_files=[], comorbid_files=[], haem_files=[], patient_files=[],
+                           critcare_files=[], radiology_files=[], events_files=["Outcomes"])
+            expected = pop._get_date_time(pop._read("Outcomes"), col_name="EVENT_DATE")
+            results = list()
+            stages = [Stage("_first", None, [], [], ["Outcomes"]),
+                      Stage("_second", None, [], [], ["Outcomes"])]
+            with mock.patch.object(pop, "_read", wraps=pop._read) as read, \
+                    mock.patch.object(pop, "_first", create=True,
+                                      new=lambda: results.append(pop._source("Outcomes", ["PATIENT_ID"]))), \
+                    mock.patch.object(pop, "_second", create=True,
+                                      new=lambda: results.append(pop._source("Outcomes",
+                                                                              date_columns=["EVENT_DATE"]))):
+                pop._run_stages(stages)
+                self.assertEqual(read.call_count, 1)
+                self.assertEqual(pop._sources, dict())
+                pop._source("Outcomes")
+                pop._source("Outcomes")
+                self.assertEqual(read.call_count, 3)
+            pop.close()
+            self.assertEqual(list(results[0].columns), ["PATIENT_ID"])
+            pd.testing.assert_frame_equal(results[1], expected)
+
+
+class TestIndexes(unittest.TestCase):
+
+    def test_build_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "test.db")
+            create_database(db_path)
+            connection = sqlite3.connect(db_path)
+            with connection:
+                connection.executemany("INSERT INTO Pathology (patient_id, collection_datetime, test_name, "
+                                       "test_category, test_result) VALUES (?,?,?,?,?)",
+                                       [(f"p{i % 50}", f"2020-03-{i % 28 + 1:02d}T10:00:00", f"T{i % 5}", "FBC",
+                                         str(i)) for i in range(500)])
+            build_indexes(connection)
+            build_indexes(connection)
+            indexes = [x[0] for x in connection.execute("SELECT name FROM sqlite_master WHERE type='index' "
+                                                        "AND name NOT LIKE 'sqlite_autoindex%'").fetchall()]
+            self.assertEqual(sorted(indexes), sorted(x.split()[5] for x in INDEXES))
+            self.assertTrue(connection.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0)
+            plan = connection.execute("EXPLAIN QUERY PLAN SELECT collection_datetime, test_result FROM Pathology "
+                                      "WHERE patient_id=? AND test_name=? ORDER BY collection_datetime",
+                                      ["p1", "T1"]).fetchall()
+            self.assertEqual(len(plan), 1)
+            self.assertIn("COVERING INDEX path_pt_name_time", plan[0][-1])
+            connection.close()
+
+
+class TestPopulate(unittest.TestCase):
+
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            tables = dict()
+            for jobs in [1, 3]:
+                database_path = os.path.join(tmp, f"jobs{jobs}.db")
+                with Populate(database_path=database_path, data_path=tmp, verbose=False, workers=1,
+                              **files) as pop:
+                    pop.populate(jobs=jobs)
+                tables[jobs] = read_tables(database_path)
+            self.assertEqual(sorted(tables[3].keys()), sorted(tables[1].keys()))
+            for name, df in tables[1].items():
+                self.assertTrue(df.shape[0] > 0, name)
+                pd.testing.assert_frame_equal(df, tables[3][name], obj=name)
+            self.assertFalse([x for x in os.listdir(tmp) if os.path.isdir(os.path.join(tmp, x))])
+
+    def test_parallel_sources_read_once(self):
+        groups = [[x.method for x in g] for g in _stage_groups(STAGES)]
+        self.assertEqual(groups[0], ["_patients", "_events", "_microbiology"])
+        self.assertEqual(sorted([x for g in groups for x in g]), sorted([x.method for x in STAGES]))
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            # Workers run as threads so that reads in every worker are counted
+            with Populate(database_path=os.path.join(tmp, "test.db"), data_path=tmp, verbose=False, workers=1,
+                          **files) as pop, \
+                    mock.patch("CHADBuilder.populate.ProcessPoolExecutor", ThreadPoolExecutor), \
+                    mock.patch.object(Populate, "_read", autospec=True, side_effect=Populate._read) as read:
+                pop.populate(jobs=3)
+            reads = Counter([x.args[1] for x in read.call_args_list])
+            self.assertEqual(reads["Covid19"], 1)
+            self.assertEqual(reads["Outcomes"], 1)
+
+    def test_drop_empty_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            tables = dict()
+            for drop in [False, True]:
+                database_path = os.path.join(tmp, f"drop{drop}.db")
+                with Populate(database_path=database_path, data_path=tmp, verbose=False, workers=1,
+                              drop_empty_results=drop, **files) as pop, \
+                        mock.patch.object(pop, "_chunk_rows", return_value=7):
+                    pop._pathology()
+                tables[drop] = read_tables(database_path)
+            pathology, summary = tables[True]["Pathology"], tables[True]["PathologySummary"]
+            self.assertFalse(pathology.test_result.isnull().any())
+            self.assertEqual(sorted(pathology.test_name.unique()), ["CRP_A1", "CRP_A3", "FBC_A1", "FBC_A3"])
+            kept = tables[False]["Pathology"]
+            kept = kept[kept.test_result.notnull()].reset_index(drop=True)
+            pd.testing.assert_frame_equal(pathology, kept)
+            summary[["total", "empty", "dropped"]] = summary[["total", "empty", "dropped"]].astype(int)
+            self.assertEqual(summary.set_index("test_name").loc[["FBC_A1", "FBC_A2", "FBC_A3"], "dropped"].tolist(),
+                             [0, 60, 30])
+            self.assertTrue((summary["empty"] == summary["dropped"]).all())
+            panels = summary.groupby("test_category")[["total", "dropped"]].sum()
+            counts = pathology.groupby("test_category").size()
+            self.assertEqual(counts.to_dict(), (panels.total - panels.dropped).to_dict())
+            self.assertEqual(tables[False]["PathologySummary"].dropped.unique().tolist(), ["0"])
+
+    def test_insert_small_frame(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            with Populate(database_path=os.path.join(tmp, "test.db"), data_path=tmp, verbose=True,
+                          **files) as pop:
+                for n in [0, 1, 3]:
+                    pop._insert(pd.DataFrame({"test_name": [f"T{i}" for i in range(n)],
+                                              "reported_units": ["g/L"] * n}), table_name="Units")
+                self.assertEqual(pop._connection.execute("SELECT test_name FROM Units").fetchall(),
+                                 [("T0",), ("T0",), ("T1",), ("T2",)])
+
+    def test_pool_lifecycle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            kwargs = dict(data_path=tmp, verbose=False, workers=2, **files)
+
+            def use_pool():
+                pools.append(pop._get_pool())
+                self.assertEqual(pools[-1].map(abs, [-1, -2]), [1, 2])
+
+            def stopped(pool):
+                with self.assertRaises(ValueError):
+                    pool.apply(abs, (-1,))
+                self.assertFalse([x for x in pool._pool if x.is_alive()])
+
+            with mock.patch.object(populate, "Pool", wraps=populate.Pool) as pool_cls:
+                # Created on first use, shared by the stages and closed on exit
+                pools = list()
+                with Populate(database_path=os.path.join(tmp, "exit.db"), **kwargs) as pop, \
+                        mock.patch.object(pop, "_comorbid", side_effect=use_pool), \
+                        mock.patch.object(pop, "_events", side_effect=use_pool):
+                    self.assertIsNone(pop._pool)
+                    pop.populate()
+                self.assertEqual(pool_cls.call_count, 1)
+                self.assertEqual(len(pools), 2)
+                self.assertIs(pools[0], pools[1])
+                self.assertIsNone(pop._pool)
+                stopped(pools[0])
+                # Closed by close()
+                pools = list()
+                pop = Populate(database_path=os.path.join(tmp, "close.db"), **kwargs)
+                use_pool()
+                pop.close()
+                self.assertIsNone(pop._pool)
+                stopped(pools[0])
+                # Terminated on exit when a stage raises
+                pools = list()
+                with self.assertRaises(ValueError):
+                    with Populate(database_path=os.path.join(tmp, "raise.db"), **kwargs) as pop, \
+                            mock.patch.object(pop, "_comorbid", side_effect=use_pool), \
+                            mock.patch.object(pop, "_events", side_effect=ValueError("bad extract")):
+                        pop.populate()
+                self.assertEqual(pool_cls.call_count, 3)
+                self.assertIsNone(pop._pool)
+                stopped(pools[0])
+
+    def test_pragmas_restored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = write_extracts(tmp)
+            with Populate(database_path=os.path.join(tmp, "test.db"), data_path=tmp, verbose=False, workers=1,
+                          **files) as pop:
+
+                def pragmas():
+                    return {k: pop._connection.execute(f"PRAGMA {k}").fetchone()[0] for k in BUILD_PRAGMAS.keys()}
+
+                expected = pragmas()
+                during = list()
+                with mock.patch.object(pop, "_comorbid", side_effect=lambda: during.append(pragmas())):
+                    pop.populate()
+                self.assertEqual(pragmas(), expected)
+                self.assertEqual(during[0]["journal_mode"], BUILD_PRAGMAS["journal_mode"].lower())
+                self.assertEqual(during[0]["synchronous"], 0)
+                with mock.patch.object(pop, "_patients", side_effect=ValueError("bad extract")):
+                    with self.assertRaises(ValueError):
+                        pop.populate()
+                self.assertEqual(pragmas(), expected)
@@ -0,0 +1,182 @@
+from ..process_data import consolidate, safe_read, ChunkedReader, _detect_encoding, clean_complex_text, \
+    _clean_file
+from ..column_specs import RESULTS_SPEC
+from .. import process_data
+from unittest import mock
+import pandas as pd
+import importlib.util
+import tempfile
+import unittest
+import os
+
+
+def _write_extracts(path: str):
+    pd.DataFrame({"PATIENT_ID": ["a", "b", "c"],
+                  "TEST_DATE": ["01/03/2020", "02/03/2020", None],
+                  "HB": [120, 131, 99]}).to_csv(os.path.join(path, "FBC-0001.csv"), index=False)
+    pd.DataFrame({"PATIENT_ID": ["d", "e"],
+                  "TEST_DATE": ["03/03/2020", "04/03/2020"],
+                  "WBC": [4.1, 7.2],
+                  "HB": [140, 101]}).to_csv(os.path.join(path, "FBC-0002.csv"), index=False)
+    pd.DataFrame({"PATIENT_ID": ["f"],
+                  "HB": [150]}).to_csv(os.path.join(path, "FBC-0003.csv"), index=False)
+    pd.DataFrame({"PATIENT_ID": ["a", "g"],
+                  "TEXT": ["Positive", "Negative"]}).to_csv(os.path.join(path, "Covid19-0001.csv"), index=False)
+
+
+class TestConsolidate(unittest.TestCase):
+
+    def _consolidate(self, tmp: str, name: str, **kwargs) -> dict:
+        os.mkdir(os.path.join(tmp, name))
+        consolidate(os.path.join(tmp, "data"), os.path.join(tmp, name), **kwargs)
+        path = os.path.join(tmp, name, "consolidated")
+        return {f: pd.read_csv(os.path.join(path, f)) for f in sorted(os.listdir(path)) if f.endswith(".csv")}
+
+    def test_streaming_matches_in_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "data"))
+            _write_extracts(os.path.join(tmp, "data"))
+            # HB mixes numbers, blanks and text; PLT is integer but missing from the second file
+            pd.DataFrame({"PATIENT_ID": ["h", "i", "j", "k", "l"],
+                          "HB": ["120", None, "Issue with result", "99", "101"],
+                          "PLT": [150, 151, 152, 153, 154]}).to_csv(os.path.join(tmp, "data", "FBC-0004.csv"),
+                                                                    index=False)
+
+            def raw(name: str) -> dict:
+                path = os.path.join(tmp, name, "consolidated")
+                files = sorted(x for x in os.listdir(path) if x.endswith(".csv"))
+                contents = dict()
+                for x in files:
+                    with open(os.path.join(path, x), "rb") as f:
+                        contents[x] = f.read()
+                return contents
+
+            self._consolidate(tmp, "memory")
+            expected = raw("memory")
+            self.assertEqual(list(expected.keys()), ["Covid19.csv", "FBC.csv"])
+            self.assertIn(b"h,,120,150.0,", expected["FBC.csv"])
+            for chunksize in [1, 2, 3]:
+                self._consolidate(tmp, f"streaming{chunksize}", chunksize=chunksize)
+                self.assertEqual(raw(f"streaming{chunksize}"), expected)
+
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(process_data, "_SPLIT_BYTES", 64):
+            os.mkdir(os.path.join(tmp, "data"))
+            _write_extracts(os.path.join(tmp, "data"))
+            with open(os.path.join(tmp, "data", "Broken-0001.csv"), "wb") as broken:
+                broken.write(b"\xff\xfe\x00")
+            expected = self._consolidate(tmp, "serial")
+            for chunksize in [None, 2]:
+                result = self._consolidate(tmp, f"parallel{chunksize}", jobs=3, chunksize=chunksize)
+                self.assertEqual(list(result.keys()), ["Covid19.csv", "FBC.csv"])
+                for file, df in expected.items():
+                    pd.testing.assert_frame_equal(df, result[file])
+
+    def test_encoding_detection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "Latin-0001.csv")
+            with open(path, "wb") as file:
+                file.write(b"PATIENT_ID,TEXT\n" + b"a,plain ascii\n" * 200 + "b,caf\u00e9 \u00a3\n".encode("cp1252"))
+            self.assertEqual(_detect_encoding(path, sample_size=256), "utf-8")
+            df = safe_read(path)
+            self.assertEqual(df.TEXT.iloc[-1], "caf\u00e9 \u00a3")
+            os.mkdir(os.path.join(tmp, "out"))
+            consolidate(tmp, os.path.join(tmp, "out"), chunksize=50)
+            consolidated = os.path.join(tmp, "out", "consolidated", "Latin.csv")
+            with open(consolidated, "rb") as file:
+                self.assertTrue(file.read().endswith("b,caf\u00e9 \u00a3\n".encode("utf-8")))
+            with mock.patch.object(process_data.chardet, "detect") as detect, \
+                    mock.patch.object(process_data, "_ENCODINGS", dict()):
+                self.assertEqual(_detect_encoding(consolidated), "utf-8")
+                detect.assert_not_called()
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_columnar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "data"))
+            _write_extracts(os.path.join(tmp, "data"))
+            for columnar in ["parquet", "feather"]:
+                expected = self._consolidate(tmp, columnar, columnar=columnar)
+                path = os.path.join(tmp, columnar, "consolidated")
+                self.assertEqual(sorted(os.listdir(path)), sorted([".encodings.json", "Covid19.csv", "FBC.csv",
+                                                                    f"Covid19.{columnar}", f"FBC.{columnar}"]))
+                result = safe_read(os.path.join(path, f"FBC.{columnar}"))
+                self.assertEqual(list(result.columns), list(expected["FBC.csv"].columns))
+                self.assertTrue(pd.api.types.is_datetime64_any_dtype(result.TEST_DATE))
+                self.assertEqual(sorted(result.TEST_DATE.dropna().dt.strftime("%Y-%m-%d")),
+                                 ["2020-03-01", "2020-03-02", "2020-03-03", "2020-03-04"])
+
+    def test_column_spec(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "FBC.csv")
+            pd.DataFrame({"PATIENT_ID": ["a", "b"], "REQUEST_LOCATION": ["ICU", "ICU"], "AGE": [50, 60],
+                          "GENDER": ["M", "F"], "ADMISSION_DATE": ["01/03/2020", None],
+                          "HB": [120, 130]}).to_csv(path, index=False)
+            df = safe_read(path, spec=RESULTS_SPEC)
+            self.assertEqual(list(df.columns), ["PATIENT_ID", "REQUEST_LOCATION", "HB"])
+            self.assertEqual(str(df.REQUEST_LOCATION.dtype), "category")
+            self.assertEqual(list(df.HB), [120, 130])
+
+    def test_chunked_reader(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "FBC.csv")
+            pd.DataFrame({"PATIENT_ID": [f"p{i}" for i in range(50)],
+                          "HB": [i if i != 45 else "Issue with result" for i in range(50)],
+                          "WBC": [i * 1.5 if i % 7 else None for i in range(50)],
+                          "PLT": [None if i < 20 else i for i in range(50)],
+                          "AGE": range(50)}).to_csv(path, index=False)
+            expected = safe_read(path, spec=RESULTS_SPEC)
+            reader = ChunkedReader(path, spec=RESULTS_SPEC, scan_chunksize=10)
+            self.assertEqual(reader.rows, 50)
+            result = pd.concat(list(reader.chunks(10)), ignore_index=True)
+            pd.testing.assert_frame_equal(expected, result)
+            self.assertEqual(reader.sample(5).shape, (5, 4))
+
+
+class TestCleanComplexText(unittest.TestCase):
+
+    def _write(self, path: str) -> dict:
+        content = {"RESPL-0001.csv": b'PATIENT_ID,TEXT\na,"Influenza \\\\A ""detected"""\nb,Negative\n',
+                   "RESPL-0002.csv.part": b'PATIENT_ID,TEXT\nc,"RSV ""detec',
+                   "FBC-0001.csv": b'PATIENT_ID,HB\na,"1""20"\n',
+                   ".hidden.csv": b'PATIENT_ID,TEXT\nd,"""quoted"""\n'}
+        for name, x in content.items():
+            with open(os.path.join(path, name), "wb") as file:
+                file.write(x)
+        return content
+
+    def _read(self, path: str) -> dict:
+        files = dict()
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), "rb") as file:
+                files[name] = file.read()
+        return files
+
+    def test_clean_complex_text(self):
+        results = list()
+        for jobs in [1, 2]:
+            with tempfile.TemporaryDirectory() as tmp:
+                content = self._write(tmp)
+                clean_complex_text(tmp, jobs=jobs)
+                result = self._read(tmp)
+                self.assertEqual(result["RESPL-0001.csv"],
+                                 b"PATIENT_ID,TEXT\r\na,Influenza A detected\r\nb,Negative\r\n")
+                # Header sniff: files without a TEXT column, partial downloads and dot-files are untouched
+                for name in ["FBC-0001.csv", "RESPL-0002.csv.part", ".hidden.csv"]:
+                    self.assertEqual(result[name], content[name], name)
+                self.assertEqual(sorted(result.keys()), sorted(content.keys()))
+                results.append(result)
+        self.assertEqual(results[0], results[1])
+
+    def test_atomic_replace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            content = self._write(tmp)
+            path = os.path.join(tmp, "RESPL-0001.csv")
+            self.assertFalse(_clean_file(os.path.join(tmp, "FBC-0001.csv")))
+            failing = ["PATIENT_ID", "TEXT", "a", OSError("disk full")]
+            with mock.patch.object(process_data, "_remove_illegal_chars", side_effect=failing):
+                with self.assertRaises(OSError):
+                    _clean_file(path)
+            self.assertEqual(self._read(tmp), content)
+            self.assertTrue(_clean_file(path))
+            self.assertFalse([x for x in os.listdir(tmp) if x.endswith(".tmp")])
@@ -0,0 +1,85 @@
+from ..utilities import parse_datetime, parse_datetimes
+from ..datetime_cache import DatetimeCache
+from .. import utilities
+from unittest import mock
+import datetime as dt
+import numpy as np
+import tempfile
+import unittest
+import os
+
+
+class TestParseDatetimes(unittest.TestCase):
+
+    def test_matches_parse_datetime(self):
+        values = ["01/03/2020 14:05", "01/03/2020", "2020-03-02 08:00:00", " 03/03/2020 ", "2020-03-04",
+                  "14:05", "5th March 2020", "March 6 2020 10:30", "31/02/2020", "not a date", "", None,
+                  np.nan, "01/03/2020 14:05", "01/03/2020 10:00:60", "2020-03-01T10:00:60"] * 3
+        expected = [parse_datetime(x) for x in values]
+        self.assertEqual(list(parse_datetimes(values)), expected)
+
+    def test_mapper_only_sees_fallback_values(self):
+        seen = list()
+
+        def mapper(func, values):
+            seen.extend(values)
+            return list(map(func, values))
+
+        parse_datetimes(["01/03/2020"] * 100 + ["5th March 2020"] * 10, mapper=mapper)
+        self.assertEqual(seen, ["5th March 2020"])
+
+
+class TestDatetimeCache(unittest.TestCase):
+
+    def test_cache_reused_across_instances(self):
+        values = ["5th March 2020", "March 6 2020 10:30", "not a date", "01/03/2020"]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "datetimes.db")
+            with DatetimeCache(path) as cache:
+                expected = parse_datetimes(values, cache=cache)
+                self.assertEqual(len(cache), 3)
+            seen = list()
+
+            def mapper(func, x):
+                seen.extend(x)
+                return list(map(func, x))
+
+            with DatetimeCache(path) as cache:
+                self.assertEqual(list(parse_datetimes(values + ["7th March 2020"], mapper=mapper, cache=cache)),
+                                 list(expected) + [parse_datetime("7th March 2020")])
+            self.assertEqual(seen, ["7th March 2020"])
+
+    def test_relative_dates_not_cached(self):
+        relative = ["14:05", "5 March", "yesterday", "March 2020"]
+        values = relative + ["5th March 2020", "not a date"]
+        with tempfile.TemporaryDirectory() as tmp:
+            with DatetimeCache(os.path.join(tmp, "datetimes.db")) as cache:
+                self.assertEqual(list(parse_datetimes(values, cache=cache)), [parse_datetime(x) for x in values])
+                self.assertEqual(sorted(cache.get(values).keys()), ["5th March 2020", "not a date"])
+                # A later build resolves relative dates against its own current date
+                tomorrow = dt.datetime.now() + dt.timedelta(days=1)
+                with mock.patch.object(utilities, "parse_datetime",
+                                       wraps=lambda x, relative_base=None:
+                                       parse_datetime(x, relative_base=relative_base or tomorrow)):
+                    expected = [parse_datetime(x, relative_base=tomorrow) for x in values]
+                    self.assertEqual(list(parse_datetimes(values, cache=cache)), expected)
+                self.assertNotEqual(expected[:3], [parse_datetime(x) for x in relative[:3]])
+
+    def test_absolute_dates_parsed_once(self):
+        values = ["5th March 2020", "March 5, 2020 14:05", "Thu 05 Mar 2020"]
+        with tempfile.TemporaryDirectory() as tmp:
+            with DatetimeCache(os.path.join(tmp, "datetimes.db")) as cache, \
+                    mock.patch.object(utilities.dateparser, "parse", wraps=utilities.dateparser.parse) as parse:
+                result = list(parse_datetimes(values, cache=cache))
+                self.assertEqual(parse.call_count, len(values))
+                self.assertEqual(sorted(cache.get(values).keys()), sorted(values))
+            self.assertEqual(result, [parse_datetime(x) for x in values])
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with DatetimeCache(os.path.join(tmp, "datetimes.db"), max_entries=10) as cache:
+                cache.put({f"old{i}": None for i in range(10)})
+                cache.get(["old0"])
+                cache.put({"new": "2020-03-05T00:00:00Z"})
+                self.assertEqual(len(cache), 9)
+                self.assertEqual(cache.get(["old0", "new"]), {"old0": None, "new": "2020-03-05T00:00:00Z"})
@@ -1,7 +1,31 @@
 from IPython import get_ipython
 from tqdm import tqdm
 from tqdm.notebook import tqdm as tqdm_notebook
+import pandas as pd
+import numpy as np
 import dateparser
+import datetime as dt
+
+# dateparser settings for _parse_datetime_absolute: relative dates (e.g. "yesterday") are not recognised and
+# strings missing the day, month or year (e.g. "14:05", "5 March") are rejected rather than completed from the
+# current date, so any result does not depend on the current date
+_ABSOLUTE_SETTINGS = {"STRICT_PARSING": True, "PARSERS": ["timestamp", "custom-formats", "absolute-time"]}
+
+# Day-first (and ISO) formats parsed without dateparser by parse_datetimes. Each gives the same result as
+# parse_datetime for any string it matches exactly, other than a seconds field of 60 (which parse_datetimes
+# leaves to parse_datetime).
+DATETIME_FORMATS = ["%d/%m/%Y %H:%M",
+                    "%d/%m/%Y %H:%M:%S",
+                    "%d/%m/%Y",
+                    "%d-%m-%Y %H:%M",
+                    "%d-%m-%Y %H:%M:%S",
+                    "%d-%m-%Y",
+                    "%d.%m.%Y %H:%M",
+                    "%d.%m.%Y %H:%M:%S",
+                    "%d.%m.%Y",
+                    "%Y-%m-%d %H:%M:%S",
+                    "%Y-%m-%dT%H:%M:%S",
+                    "%Y-%m-%d"]
 
 
 def which_environment() -> str:
@@ -49,7 +73,8 @@ def progress_bar(x: iter or None = None,
     return tqdm(x, **kwargs)
 
 
-def parse_datetime(datetime: str or None) -> dict or None:
+def parse_datetime(datetime: str or None,
+                   relative_base: dt.datetime or None = None) -> dict or None:
     """
     Takes a datetime as string and returns a ISO 8601 standard datetime string. Implements the dateparser
     library for flexible date time parsing (https://dateparser.readthedocs.io/). Assumes GB formatting for
@@ -59,6 +84,9 @@ def parse_datetime(datetime: str or None) -> dict or None:
     ----------
     datetime: str
         datetime string to parse, can be date, or date and time.
+    relative_base: datetime.datetime, optional
+        Date that relative or incomplete dates (e.g. "yesterday", "14:05") are resolved against; defaults to
+        the current date
     Returns
     -------
     dict or None
@@ -67,12 +95,125 @@ def parse_datetime(datetime: str or None) -> dict or None:
     if type(datetime) is not str:
         return None
     datetime = datetime.strip()
-    datetime = dateparser.parse(datetime, locales=["en-GB"])
+    settings = None if relative_base is None else {"RELATIVE_BASE": relative_base}
+    datetime = dateparser.parse(datetime, locales=["en-GB"], settings=settings)
     if datetime is None:
         return None
     return datetime.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+def _parse_datetime_absolute(datetime: str) -> tuple:
+    """
+    parse_datetime, also reporting whether the result is independent of the current date. Strings without an
+    explicit full date are resolved against the current date by dateparser, so their results must not be
+    kept in a persistent cache. Strings with a full date are parsed by a single call to dateparser (see
+    _ABSOLUTE_SETTINGS); others are then parsed as by parse_datetime.
+
+    Parameters
+    ----------
+    datetime: str
+
+    Returns
+    -------
+    tuple
+        (ISO 8601 formatted string or None, True if the result does not depend on the current date)
+    """
+    if type(datetime) is not str:
+        return None, True
+    value = dateparser.parse(datetime.strip(), locales=["en-GB"], settings=_ABSOLUTE_SETTINGS)
+    if value is not None:
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ"), True
+    # Relative, incomplete or not a date; only the last can be kept
+    value = parse_datetime(datetime)
+    return value, value is None
+
+
+def _infer_formats(values: pd.Series,
+                   sample_size: int = 1000) -> list:
+    """
+    Determine which of DATETIME_FORMATS occur in a sample of values, most frequent first
+
+    Parameters
+    ----------
+    values: Pandas.Series
+        Stripped strings
+    sample_size: int, default=1000
+
+    Returns
+    -------
+    list
+    """
+    sample = values.iloc[:sample_size]
+    counts = dict()
+    for fmt in DATETIME_FORMATS:
+        matched = pd.to_datetime(sample, format=fmt, errors="coerce").notnull()
+        if matched.any():
+            counts[fmt] = matched.sum()
+            sample = sample[~matched]
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+def parse_datetimes(values: iter,
+                    mapper: callable = map,
+                    cache: object or None = None) -> np.ndarray:
+    """
+    Vectorised equivalent of applying parse_datetime to every value. The formats (from DATETIME_FORMATS)
+    present in the values are inferred from a sample and parsed in bulk by Pandas; only distinct values that
+    match none of these formats are passed to parse_datetime (and so dateparser), and only if they are not
+    already held in the cache.
+
+    Parameters
+    ----------
+    values: iterable
+        Date and/or time strings; non-string values give None
+    mapper: callable, default=map
+        Used to apply parse_datetime to the remaining values, called as mapper(func, values) e.g. the map
+        method of a multiprocessing Pool
+    cache: CHADBuilder.datetime_cache.DatetimeCache, optional
+        Persistent cache of values parsed by parse_datetime; updated with any newly parsed values, except
+        those resolved against the current date (e.g. "14:05", "5 March" or "yesterday")
+
+    Returns
+    -------
+    Numpy.Array
+        Object array of ISO 8601 formatted strings (YYYY-MM-DDThh:mm:ssZ) or None
+    """
+    values = pd.Series(values, dtype=object)
+    is_str = values.map(lambda x: type(x) is str)
+    result = np.full(len(values), None, dtype=object)
+    if not is_str.any():
+        return result
+    unique = pd.Series(values[is_str].unique(), dtype=object)
+    stripped = unique.str.strip()
+    parsed = pd.Series(None, index=unique.index, dtype=object)
+    # Pandas rolls a seconds field of 60 over into the next minute whereas parse_datetime rejects it, so these
+    # strings are left to parse_datetime
+    leap_second = stripped.str.endswith(":60")
+    remaining = stripped[~leap_second]
+    for fmt in _infer_formats(remaining.drop_duplicates()):
+        matched = pd.to_datetime(remaining, format=fmt, errors="coerce")
+        matched = matched[matched.notnull()]
+        parsed[matched.index] = matched.dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+        remaining = remaining.drop(matched.index)
+        if remaining.shape[0] == 0:
+            break
+    remaining = pd.concat([remaining, stripped[leap_second]])
+    if remaining.shape[0] != 0:
+        fallback = remaining.unique()
+        cached = cache.get(fallback) if cache is not None else dict()
+        fallback = [x for x in fallback if x not in cached]
+        if fallback and cache is None:
+            cached.update(zip(fallback, mapper(parse_datetime, fallback)))
+        elif fallback:
+            new = dict(zip(fallback, mapper(_parse_datetime_absolute, fallback)))
+            cache.put({k: v for k, (v, absolute) in new.items() if absolute})
+            cached.update({k: v for k, (v, absolute) in new.items()})
+        parsed[remaining.index] = remaining.map(cached).values
+    lookup = {k: v if type(v) is str else None for k, v in zip(unique.values, parsed.values)}
+    result[is_str.values] = [lookup[x] for x in values[is_str].values]
+    return result
+
+
 def verbose_print(verbose: bool):
     """
     Verbose printing
@@ -0,0 +1,75 @@
+"""
+Offline throughput benchmark for CHADBuilder.fetch_data, run against the local securefileshare stand-in
+(CHADBuilder.tests.securefileshare_server). Run from the repository root:
+
+    python -m benchmarks.fetch [--files 200] [--size 262144] [--latency 0.02] [--error-rate 0.05]
+"""
+from CHADBuilder.tests.securefileshare_server import SecureFileShareStub
+from CHADBuilder.fetch_data import get_pages, get_files, TokenProvider
+import contextlib
+import argparse
+import tempfile
+import time
+import io
+import os
+
+
+def run(workers: int,
+        n_files: int,
+        file_size: int,
+        latency: float,
+        error_rate: float,
+        truncate_rate: float,
+        token_lifetime: float) -> dict:
+    """
+    Run 'get_pages' followed by 'get_files' against a fresh stand-in server
+
+    Returns
+    -------
+    dict
+        Timings, throughput and retry counts
+    """
+    stub = SecureFileShareStub(n_files=n_files, file_size=file_size, latency=latency, error_rate=error_rate,
+                               truncate_rate=truncate_rate, token_lifetime=token_lifetime)
+    with stub, tempfile.TemporaryDirectory() as tmp:
+        stub.write_credentials(os.path.join(tmp, "login.txt"))
+        provider = TokenProvider(stub.filehost, credentials_path=os.path.join(tmp, "login.txt"))
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            pages = get_pages(filehost=stub.filehost, token_provider=provider, sleep=0.05, max_repeats=20)
+            listed = time.perf_counter()
+            get_files(pages, output_dir=tmp, filehost=stub.filehost, token_provider=provider, sleep=0.05,
+                      max_repeats=20, workers=workers)
+            end = time.perf_counter()
+        n_bytes = sum(len(x["content"]) for x in stub.files.values())
+        return {"workers": workers,
+                "pages_s": listed - start,
+                "files_s": end - listed,
+                "files_per_s": n_files / (end - listed),
+                "mb_per_s": n_bytes / (end - listed) / 1e6,
+                "retries": stub.retries,
+                "token_requests": stub.counters["token"] + stub.counters["refresh"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=262144)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--truncate-rate", type=float, default=0.02)
+    parser.add_argument("--token-lifetime", type=float, default=3600.)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    print(f"{'workers':>8} {'list (s)':>9} {'fetch (s)':>10} {'files/s':>8} {'MB/s':>7} {'retries':>8} "
+          f"{'tokens':>7}")
+    for workers in args.workers:
+        result = run(workers, args.files, args.size, args.latency, args.error_rate, args.truncate_rate,
+                     args.token_lifetime)
+        print(f"{result['workers']:>8} {result['pages_s']:>9.2f} {result['files_s']:>10.2f} "
+              f"{result['files_per_s']:>8.1f} {result['mb_per_s']:>7.1f} {result['retries']:>8} "
+              f"{result['token_requests']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of CHADBuilder.utilities.parse_datetimes against applying parse_datetime to every value, on
+synthetic columns shaped like the C&V extracts (repeated day-first timestamps with a few free-text dates).
+Run from the repository root:
+
+    python -m benchmarks.parse_datetime [--rows 20000] [--unique 2000]
+"""
+from CHADBuilder.utilities import parse_datetime, parse_datetimes
+import argparse
+import random
+import time
+
+
+def column(rows: int,
+           unique: int,
+           seed: int = 42) -> list:
+    """
+    Synthetic date/time column of 'rows' values drawn from 'unique' distinct values
+    """
+    rng = random.Random(seed)
+    values = list()
+    for i in range(unique):
+        day, month, hour, minute = rng.randint(1, 28), rng.randint(1, 12), rng.randint(0, 23), rng.randint(0, 59)
+        kind = rng.random()
+        if kind < 0.6:
+            values.append(f"{day:02d}/{month:02d}/2020 {hour:02d}:{minute:02d}")
+        elif kind < 0.9:
+            values.append(f"{day:02d}/{month:02d}/2020")
+        elif kind < 0.98:
+            values.append(f"2020-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:00")
+        else:
+            values.append(f"{day} March 2020")
+    return [rng.choice(values) if rng.random() > 0.05 else None for _ in range(rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--unique", type=int, default=2000)
+    args = parser.parse_args()
+    values = column(args.rows, args.unique)
+    start = time.perf_counter()
+    expected = [parse_datetime(x) for x in values]
+    scalar = time.perf_counter() - start
+    start = time.perf_counter()
+    result = parse_datetimes(values)
+    vectorised = time.perf_counter() - start
+    assert list(result) == expected
+    print(f"{'rows':>8} {'unique':>7} {'parse_datetime (s)':>19} {'parse_datetimes (s)':>20} {'speedup':>8}")
+    print(f"{args.rows:>8} {args.unique:>7} {scalar:>19.2f} {vectorised:>20.3f} {scalar / vectorised:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the per-patient steps of CHADBuilder.populate.Populate._patients - death registration
+(register_deaths) and COVID-19 status (summarise_covid_results) - on synthetic Outcomes and Covid19 extracts.
+The previous per-patient implementations are timed on a subset of patients (--legacy-patients) and
+extrapolated, as their cost grows with patients x rows. Run from the repository root:
+
+    python -m benchmarks.patients [--patients 200000] [--events 1000000] [--results 500000]
+"""
+from CHADBuilder.populate import register_deaths, summarise_covid_results, search_covid_results
+import pandas as pd
+import numpy as np
+import argparse
+import time
+
+DIED_EVENTS = ['Died - DEATHS INCLUDING STILLBIRTHS',
+               'Died In Dept.',
+               'Died - USUAL PLACE OF RESIDENCE',
+               'Died - NHS HOSP OTHER PROV - GENERAL']
+
+
+def synthetic(patients: int,
+              events: int,
+              results: int,
+              seed: int = 42) -> tuple:
+    """
+    Synthetic patient IDs, Outcomes events and Covid19 results
+    """
+    rng = np.random.default_rng(seed)
+    patient_ids = pd.Series([f"P{i:08d}" for i in range(patients)])
+    destinations = DIED_EVENTS + ["Home", "Usual Place of Residence", "Transfer", "Other"] * 20
+    outcomes = pd.DataFrame({"PATIENT_ID": patient_ids.sample(events, replace=True, random_state=seed).values,
+                             "DESTINATION": rng.choice(destinations, events)})
+    dates = pd.to_datetime(rng.integers(1583020800, 1604188800, results), unit="s", utc=True)
+    covid = pd.DataFrame({"PATIENT_ID": patient_ids.sample(results, replace=True, random_state=seed + 1).values,
+                          "TEXT": rng.choice(["Positive", "Negative", "Negative", "In Progress"], results),
+                          "collection_datetime": dates,
+                          "test_datetime": dates})
+    return patient_ids, outcomes, covid
+
+
+def legacy_register_deaths(patient_ids: pd.Series,
+                           events: pd.DataFrame) -> list:
+    death_status = list()
+    for pt_id in patient_ids.unique():
+        pt_events = events[events.PATIENT_ID == pt_id]
+        pt_events = pt_events[pt_events.DESTINATION.isin(DIED_EVENTS)]
+        death_status.append(0 if pt_events.shape[0] == 0 else 1)
+    return death_status
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=200000)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--results", type=int, default=500000)
+    parser.add_argument("--legacy-patients", type=int, default=200)
+    args = parser.parse_args()
+    patient_ids, outcomes, covid = synthetic(args.patients, args.events, args.results)
+    subset = patient_ids.iloc[:args.legacy_patients]
+    scale = args.patients / args.legacy_patients
+    deaths, new = timed(register_deaths, patient_ids, outcomes, DIED_EVENTS)
+    legacy, old = timed(legacy_register_deaths, subset, outcomes)
+    assert list(deaths[:args.legacy_patients]) == legacy
+    print(f"{'step':>14} {'patients':>9} {'rows':>8} {'legacy (s, est.)':>17} {'grouped (s)':>12}")
+    print(f"{'death':>14} {args.patients:>9} {args.events:>8} {old * scale:>17.1f} {new:>12.2f}")
+    summary, new = timed(summarise_covid_results, covid)
+    legacy, old = timed(lambda: [search_covid_results(x, covid) for x in subset])
+    for pt_id, expected in zip(subset, legacy):
+        result = tuple(summary.loc[pt_id]) if pt_id in summary.index else ("U", None)
+        assert result == expected
+    print(f"{'covid status':>14} {args.patients:>9} {args.results:>8} {old * scale:>17.1f} {new:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
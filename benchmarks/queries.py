@@ -0,0 +1,182 @@
+"""
+Benchmark of the index plan built by CHADBuilder.populate.Populate.create_indexes (INDEXES, built in one
+transaction followed by ANALYZE) against the previous single-column indexes, committed one at a time. A database
+with the standard schema is filled with synthetic Pathology, Microbiology and Events rows; the build time of
+each plan and the median latency of typical queries (results for a patient and test, or for a test category and
+test over a period, in time order) are reported. Run from the repository root:
+
+    python -m benchmarks.queries [--patients 20000] [--pathology 2000000] [--repeats 200]
+"""
+from CHADBuilder.schema import create_database
+from CHADBuilder.populate import build_indexes, BUILD_PRAGMAS
+import pandas as pd
+import numpy as np
+import sqlite3
+import argparse
+import tempfile
+import time
+import os
+
+LEGACY_INDEXES = ["CREATE INDEX crit_care_pt_id ON CritCare (patient_id)",
+                  "CREATE INDEX events_pt_id ON Events (patient_id)",
+                  "CREATE INDEX radiology_pt_id ON Radiology (patient_id)",
+                  "CREATE INDEX haem_pt_id ON ComplexHaematology (patient_id)",
+                  "CREATE INDEX micro_pt_id ON Microbiology (patient_id)",
+                  "CREATE INDEX path_pt_id ON Pathology (patient_id)",
+                  "CREATE INDEX crit_care_ventilated ON CritCare (ventilated)",
+                  "CREATE INDEX crit_care_covid ON CritCare (covid_status)",
+                  "CREATE INDEX type_event ON Events (event_type)",
+                  "CREATE INDEX covid_event ON Events (covid_status)",
+                  "CREATE INDEX test_haem ON ComplexHaematology (test_category)",
+                  "CREATE INDEX name_micro ON Microbiology (test_name)",
+                  "CREATE INDEX result_micro ON Microbiology (test_result)",
+                  "CREATE INDEX name_path ON Pathology (test_name)",
+                  "CREATE INDEX cat_path ON Pathology (test_category)"]
+
+QUERIES = {"patient test history":
+           ("SELECT collection_datetime, test_result FROM Pathology "
+            "WHERE patient_id=? AND test_name=? ORDER BY collection_datetime", ["patient_id", "test_name"]),
+           "test over period":
+           ("SELECT patient_id, collection_datetime, test_result FROM Pathology "
+            "WHERE test_category=? AND test_name=? AND collection_datetime BETWEEN ? AND ? "
+            "ORDER BY collection_datetime", ["test_category", "test_name", "start", "end"]),
+           "patient microbiology":
+           ("SELECT collection_datetime, test_result FROM Microbiology "
+            "WHERE patient_id=? AND test_name=? ORDER BY collection_datetime", ["patient_id", "micro_name"]),
+           "positive microbiology":
+           ("SELECT patient_id, collection_datetime FROM Microbiology "
+            "WHERE test_name=? AND test_result='Positive' ORDER BY collection_datetime", ["micro_name"]),
+           "patient events":
+           ("SELECT event_type, event_datetime FROM Events WHERE patient_id=? ORDER BY event_datetime",
+            ["patient_id"])}
+
+
+def _dates(rng: np.random.Generator,
+           n: int) -> np.ndarray:
+    seconds = rng.integers(1583020800, 1604188800, n)
+    return np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s")
+
+
+def synthetic(db_path: str,
+              patients: int,
+              pathology: int,
+              seed: int = 42) -> dict:
+    """
+    Fill a new database with synthetic rows; returns the values queries are parameterised with
+    """
+    rng = np.random.default_rng(seed)
+    patient_ids = np.array([f"P{i:08d}" for i in range(patients)], dtype=object)
+    categories = np.array([f"PANEL{i}" for i in range(20)], dtype=object)
+    test_category = rng.choice(categories, pathology)
+    test_name = (test_category + "_" + rng.integers(0, 8, pathology).astype(str).astype(object))
+    tables = {"Pathology": pd.DataFrame({"patient_id": rng.choice(patient_ids, pathology),
+                                         "collection_datetime": _dates(rng, pathology),
+                                         "test_name": test_name,
+                                         "test_category": test_category,
+                                         "test_result": rng.normal(100, 20, pathology).round(1)}),
+              "Microbiology": pd.DataFrame({"patient_id": rng.choice(patient_ids, pathology // 10),
+                                            "collection_datetime": _dates(rng, pathology // 10),
+                                            "test_name": rng.choice(["AsperELISA", "AsperPCR", "BCult", "RESPL"],
+                                                                    pathology // 10),
+                                            "test_result": rng.choice(["Positive", "Negative", "Negative",
+                                                                       "Negative", "Not detected"],
+                                                                      pathology // 10)}),
+              "Events": pd.DataFrame({"patient_id": rng.choice(patient_ids, pathology // 4),
+                                      "event_type": rng.choice(["ADMISSION", "DISCHARGE", "TRANSFER"],
+                                                               pathology // 4),
+                                      "event_datetime": _dates(rng, pathology // 4)})}
+    create_database(db_path, overwrite=True)
+    with sqlite3.connect(db_path) as connection:
+        for table, df in tables.items():
+            statement = f"INSERT INTO {table} ({', '.join(df.columns)}) VALUES ({', '.join('?' * df.shape[1])})"
+            connection.executemany(statement, df.itertuples(index=False, name=None))
+    connection.close()
+    pathology = tables["Pathology"]
+    return {"patient_id": pathology.patient_id.values,
+            "test_name": pathology.test_name.values,
+            "test_category": pathology.test_category.values,
+            "micro_name": tables["Microbiology"].test_name.values}
+
+
+def _legacy_build(connection: sqlite3.Connection):
+    for x in LEGACY_INDEXES:
+        connection.execute(x)
+        connection.commit()
+
+
+def _build(connection: sqlite3.Connection):
+    for k, v in BUILD_PRAGMAS.items():
+        connection.execute(f"PRAGMA {k}={v}")
+    build_indexes(connection)
+
+
+def _parameters(values: dict,
+                repeats: int,
+                seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(values["patient_id"]), repeats)
+    starts = _dates(rng, repeats)
+    ends = np.datetime_as_string(starts.astype("datetime64[s]") + np.timedelta64(14, "D"), unit="s")
+    return [{"patient_id": values["patient_id"][i],
+             "test_name": values["test_name"][i],
+             "test_category": values["test_category"][i],
+             "micro_name": values["micro_name"][i % len(values["micro_name"])],
+             "start": start,
+             "end": end} for i, start, end in zip(rows, starts, ends)]
+
+
+def run_queries(db_path: str,
+                parameters: list) -> dict:
+    """
+    Median latency (ms) and results of each query over the given parameters
+    """
+    connection = sqlite3.connect(db_path)
+    results = dict()
+    for name, (query, keys) in QUERIES.items():
+        latencies, rows = list(), list()
+        for params in parameters:
+            start = time.perf_counter()
+            rows.append(connection.execute(query, [params[k] for k in keys]).fetchall())
+            latencies.append(time.perf_counter() - start)
+        plan = " / ".join(x[-1] for x in connection.execute(f"EXPLAIN QUERY PLAN {query}",
+                                                             [parameters[0][k] for k in keys]).fetchall())
+        results[name] = (np.median(latencies) * 1000, rows, plan)
+    connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--pathology", type=int, default=2000000)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--plans", action="store_true", help="Print the query plan used by each index plan")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "queries.db")
+        values = synthetic(db_path, args.patients, args.pathology)
+        parameters = _parameters(values, args.repeats)
+        timings = dict()
+        for label, build in [("legacy", _legacy_build), ("composite", _build)]:
+            base = os.path.join(tmp, f"{label}.db")
+            with open(db_path, "rb") as src, open(base, "wb") as dst:
+                dst.write(src.read())
+            connection = sqlite3.connect(base)
+            start = time.perf_counter()
+            build(connection)
+            connection.close()
+            timings[label] = (time.perf_counter() - start, run_queries(base, parameters))
+    legacy, composite = timings["legacy"], timings["composite"]
+    print(f"{'':>22} {'legacy':>10} {'composite':>10}")
+    print(f"{'index build (s)':>22} {legacy[0]:>10.1f} {composite[0]:>10.1f}")
+    for name in QUERIES.keys():
+        # Rows with equal timestamps may be returned in either order
+        assert [sorted(x) for x in legacy[1][name][1]] == [sorted(x) for x in composite[1][name][1]], name
+        print(f"{name + ' (ms)':>22} {legacy[1][name][0]:>10.2f} {composite[1][name][0]:>10.2f}")
+    if args.plans:
+        for name in QUERIES.keys():
+            print(f"{name}:\n    legacy: {legacy[1][name][2]}\n    composite: {composite[1][name][2]}")
+
+
+if __name__ == "__main__":
+    main()